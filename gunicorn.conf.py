@@ -0,0 +1,18 @@
+# Gunicorn settings for self-hosted deployments (Vercel does not use this file)
+# Run with: gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = "main:app_handler"
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5050')}")
+
+# Requests spend almost all their time waiting on Gemini and Supabase, so each
+# worker serves many of them from a thread pool. Gemini calls are awaited on a
+# per-process event loop, so threads only block while waiting for results.
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# Three sequential-at-worst Gemini calls must fit inside the worker timeout
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
@@ -1,37 +1,211 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import JSONProvider, DefaultJSONProvider
 from flask_cors import CORS
 from google import genai
 from google.genai import types
 import os
-import json
 import logging
-from datetime import datetime, timedelta
-import re
-from typing import Dict, List, Optional, Any, Union
+import logging.handlers
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Union, Tuple, Awaitable, TypeVar, AsyncIterator, Iterator, Set
 import uuid
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+import hashlib
+import time
+import math
+import queue
+from collections import Counter, OrderedDict
 from functools import wraps
 
+import httpx
+import orjson
+from pydantic import BaseModel
+
 # Supabase imports
-from supabase import create_client, Client
+from supabase import create_client, ClientOptions
+from postgrest.exceptions import APIError
 import jwt
-from dateutil import parser
+from dotenv import load_dotenv
+
+# Load environment variables for local development (no-op without a .env file)
+load_dotenv()
+
+class OrjsonProvider(JSONProvider):
+    """Serialize jsonify() and app.json through orjson's C encoder"""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.dumpb(obj).decode()
+    
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # Write the encoded bytes straight into the body, skipping a str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj) + b"\n", mimetype="application/json")
+    
+    @staticmethod
+    def dumpb(obj: Any) -> bytes:
+        """Encode to UTF-8 JSON bytes; unsupported types fall back to Flask's default handling"""
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=orjson.OPT_NON_STR_KEYS)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
+# Largest request body accepted from any client; guest data imports are the
+# biggest legitimate payloads
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', str(1024 * 1024)))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global variables
-analyzer = None
-supabase: Optional[Client] = None
+# Optionally hand log records to a background thread so request threads never
+# wait on log output. Off by default: Vercel freezes the process after each
+# response, which would hold queued records back until the next request
+if os.getenv('QUEUE_LOGGING', '').lower() in ('1', 'true', 'yes'):
+    _root_logger = logging.getLogger()
+    _log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+    _root_logger.handlers = [logging.handlers.QueueHandler(_log_queue)]
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+# Configuration is read once at import; changing it needs a redeploy either way
+JWT_SECRET = os.getenv('JWT_SECRET', 'fallback-secret-key')
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
+# Optional; only used for the shared LLM response cache
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+
+# Which required settings are present, as reported by the debug endpoint
+ENV_STATUS: Dict[str, str] = {
+    name: "set" if os.environ.get(name) else "missing"
+    for name in ('SUPABASE_URL', 'SUPABASE_ANON_KEY', 'JWT_SECRET')
+}
+
+# API limits, shared by request handling and the documentation endpoints
+MAX_ENTRY_LENGTH = 5000
+YSYM_THRESHOLD = 0.6  # Negative emotion ratio at which YSYM analysis is added
+MAX_SEARCH_RESULTS = 100
+HISTORICAL_DAYS_DEFAULT = 21
+# /api/analyze bodies above this can't hold a valid entry, even with every
+# character \u-escaped, so they are rejected before parsing
+MAX_ANALYZE_BODY_BYTES = 64 * 1024
+API_LIMITS: Dict[str, Any] = {
+    "max_entry_length": MAX_ENTRY_LENGTH,
+    "ysym_trigger_threshold": YSYM_THRESHOLD,
+    "max_search_results": MAX_SEARCH_RESULTS,
+    "historical_days_default": HISTORICAL_DAYS_DEFAULT
+}
+
+T = TypeVar('T')
+
+# Historical stats (see aggregate_entry_stats) can be handed to the pipelines
+# while they are still loading
+HistorySource = Union[Dict[str, Any], "concurrent.futures.Future[Dict[str, Any]]", None]
+
+# Gemini calls run on one long-lived background event loop. Views stay
+# synchronous WSGI handlers, and the async client's connection pool is not
+# torn down with a per-request loop.
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="gemini-event-loop", daemon=True).start()
+    return _event_loop
+
+def submit_async(coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+    """Start a coroutine on the shared event loop without waiting for it"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+def run_async(coro: Awaitable[T]) -> T:
+    """Run a coroutine on the shared event loop and block until it completes"""
+    return submit_async(coro).result()
+
+def iterate_async(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Consume an async iterator on the shared event loop from synchronous code"""
+    loop = get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # Let the async generator clean up if the consumer stops early
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+def aggregate_entry_stats(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Python equivalent of the get_user_entry_stats database function"""
+    emotion_sums: Counter = Counter()
+    topic_counts: Counter = Counter()
+    
+    for entry in entries:
+        if entry.get('emotions_quantified'):
+            emotion_sums.update(entry['emotions_quantified'])
+        
+        if entry.get('topics'):
+            topic_counts.update(entry['topics'])
+    
+    return {
+        'entry_count': len(entries),
+        'emotion_sums': dict(emotion_sums),
+        'topic_counts': dict(topic_counts)
+    }
+
+# Upper bound on concurrent connections to Supabase per process
+SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', '20'))
 
 class SupabaseManager:
-    def __init__(self, url: str, key: str):
-        self.client = create_client(url, key)
+    def __init__(self, url: str, key: str, service_key: Optional[str] = None):
+        self.http_client = self._create_http_client()
+        self.client = create_client(url, key, options=ClientOptions(httpx_client=self.http_client))
+        # llm_cache has row level security and no policies, so only the service-role
+        # key can reach it; without one the shared LLM cache is off. It gets its own
+        # HTTP client because the Supabase client sets its key on the client's headers
+        self.cache_http_client = self._create_http_client() if service_key else None
+        self.cache_client = create_client(
+            url, service_key, options=ClientOptions(httpx_client=self.cache_http_client)
+        ) if service_key else None
+        # Cleared if the database predates the matching migrations
+        self._entry_rpc_available = True
+        self._bulk_entry_rpc_available = True
+        self._stats_rpc_available = True
+        self._llm_cache_available = self.cache_client is not None
+        self._llm_cache_pruned_at = 0.0
         logger.info("Supabase client initialized successfully")
     
+    @staticmethod
+    def _create_http_client() -> httpx.Client:
+        """Pooled HTTP client for PostgREST calls, closed at exit"""
+        # Idle connections stay open between requests so warm invocations skip the
+        # TCP/TLS handshake, and HTTP/2 lets concurrent requests share a connection
+        http_client = httpx.Client(
+            transport=httpx.HTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_POOL_SIZE,
+                    max_keepalive_connections=max(1, SUPABASE_POOL_SIZE // 2),
+                    keepalive_expiry=30
+                ),
+                # Retries only failed connection attempts, so writes are never sent twice
+                retries=3
+            ),
+            timeout=httpx.Timeout(10.0)
+        )
+        atexit.register(http_client.close)
+        return http_client
+    
     def create_user(self, email: Optional[str] = None, username: Optional[str] = None) -> Dict[str, Any]:
         """Create a new user and return user data with tokens"""
         try:
@@ -67,7 +241,7 @@ class SupabaseManager:
                 return {'success': False, 'error': 'Failed to create user'}
                 
         except Exception as e:
-            logger.error(f"Error creating user: {str(e)}")
+            logger.error("Error creating user: %s", e)
             return {'success': False, 'error': str(e)}
     
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
@@ -76,7 +250,7 @@ class SupabaseManager:
             result = self.client.table('users').select('*').eq('email', email).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            logger.error(f"Error getting user by email: {str(e)}")
+            logger.error("Error getting user by email: %s", e)
             return None
     
     def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
@@ -85,12 +259,54 @@ class SupabaseManager:
             result = self.client.table('users').select('*').eq('user_id', user_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            logger.error(f"Error getting user by ID: {str(e)}")
+            logger.error("Error getting user by ID: %s", e)
             return None
     
+    @staticmethod
+    def _analysis_fields(analysis_result: Dict[str, Any], mindweave_reflection: str,
+                         ysym_analysis: Optional[str]) -> Dict[str, Any]:
+        """Column values for an analyses row"""
+        return {
+            'emotions_quantified': analysis_result.get('emotions_quantified', {}),
+            'emotion_polarity': analysis_result.get('emotion_polarity', {}),
+            'topics': analysis_result.get('topics', []),
+            'mindweave_reflection': mindweave_reflection,
+            'ysym_triggered': analysis_result.get('emotion_polarity', {}).get('negative', 0) >= YSYM_THRESHOLD,
+            'ysym_analysis': ysym_analysis,
+            'analysis_version': '0.2.0'
+        }
+    
     def store_entry_and_analysis(self, user_id: str, entry_text: str, analysis_result: Dict[str, Any], 
                                 mindweave_reflection: str, ysym_analysis: Optional[str] = None) -> bool:
         """Store entry and analysis results"""
+        try:
+            analysis_fields = self._analysis_fields(analysis_result, mindweave_reflection, ysym_analysis)
+        except Exception as e:
+            # Malformed analysis (e.g. imported guest data); nothing is written
+            logger.error("Error storing entry and analysis: %s", e)
+            return False
+        
+        if self._entry_rpc_available:
+            try:
+                # Both rows are written server-side in one round trip and one transaction
+                result = self.client.rpc('insert_entry_with_analysis', {
+                    'p_user_id': user_id,
+                    'p_entry_text': entry_text,
+                    **{f'p_{name}': value for name, value in analysis_fields.items()}
+                }).execute()
+                return bool(result.data)
+                
+            except APIError as e:
+                if e.code != 'PGRST202':
+                    logger.error("Error storing entry and analysis: %s", e)
+                    return False
+                logger.warning("insert_entry_with_analysis function not found - falling back to separate inserts")
+                self._entry_rpc_available = False
+                
+            except Exception as e:
+                logger.error("Error storing entry and analysis: %s", e)
+                return False
+        
         try:
             # Insert entry
             entry_data = {
@@ -109,13 +325,7 @@ class SupabaseManager:
             analysis_data = {
                 'entry_id': entry_id,
                 'user_id': user_id,
-                'emotions_quantified': analysis_result.get('emotions_quantified', {}),
-                'emotion_polarity': analysis_result.get('emotion_polarity', {}),
-                'topics': analysis_result.get('topics', []),
-                'mindweave_reflection': mindweave_reflection,
-                'ysym_triggered': analysis_result.get('emotion_polarity', {}).get('negative', 0) >= 0.6,
-                'ysym_analysis': ysym_analysis,
-                'analysis_version': '0.2.0'
+                **analysis_fields
             }
             
             analysis_result_db = self.client.table('analyses').insert(analysis_data).execute()
@@ -123,10 +333,59 @@ class SupabaseManager:
             return bool(analysis_result_db.data)
             
         except Exception as e:
-            logger.error(f"Error storing entry and analysis: {str(e)}")
+            logger.error("Error storing entry and analysis: %s", e)
             return False
     
-    def get_user_historical_entries(self, user_id: str, days_back: int = 21) -> List[Dict[str, Any]]:
+    def store_entries_and_analyses(self, user_id: str, items: List[Dict[str, Any]]) -> int:
+        """Store several entries with their analyses, returning how many were stored"""
+        # Malformed items are skipped (and so count as not stored) instead of
+        # failing the whole batch
+        rows = []
+        for item in items:
+            try:
+                rows.append((item, {
+                    'entry_text': item['entry_text'],
+                    **self._analysis_fields(item['analysis'], item['mindweave_reflection'],
+                                            item.get('ysym_analysis'))
+                }))
+            except Exception as e:
+                logger.warning("Skipping malformed entry: %s", e)
+        
+        if not rows:
+            return 0
+        
+        if self._bulk_entry_rpc_available:
+            try:
+                # The whole batch is written server-side in one round trip and one transaction
+                result = self.client.rpc('insert_entries_with_analyses', {
+                    'p_user_id': user_id,
+                    'p_items': [fields for _, fields in rows]
+                }).execute()
+                return result.data or 0
+                
+            except APIError as e:
+                if e.code == 'PGRST202':
+                    logger.warning("insert_entries_with_analyses function not found - storing entries one by one")
+                    self._bulk_entry_rpc_available = False
+                else:
+                    # The batch was rolled back; store row by row so one bad item doesn't sink the rest
+                    logger.warning("Bulk insert failed, storing entries one by one: %s", e)
+                
+            except Exception as e:
+                logger.warning("Bulk insert failed, storing entries one by one: %s", e)
+        
+        return sum(
+            self.store_entry_and_analysis(
+                user_id=user_id,
+                entry_text=item['entry_text'],
+                analysis_result=item['analysis'],
+                mindweave_reflection=item['mindweave_reflection'],
+                ysym_analysis=item.get('ysym_analysis')
+            )
+            for item, _ in rows
+        )
+    
+    def get_user_historical_entries(self, user_id: str, days_back: int = HISTORICAL_DAYS_DEFAULT) -> List[Dict[str, Any]]:
         """Get user's historical entries for MindWeave analysis"""
         try:
             # Use the database function we created
@@ -138,14 +397,58 @@ class SupabaseManager:
             return result.data if result.data else []
             
         except Exception as e:
-            logger.error(f"Error getting historical entries: {str(e)}")
+            logger.error("Error getting historical entries: %s", e)
             return []
     
+    def get_user_entry_stats(self, user_id: str, days_back: int = HISTORICAL_DAYS_DEFAULT) -> Dict[str, Any]:
+        """Get entry count, summed emotions and topic counts for the user's recent entries"""
+        if self._stats_rpc_available:
+            try:
+                # Aggregated in Postgres so only the totals cross the wire
+                result = self.client.rpc('get_user_entry_stats', {
+                    'p_user_id': user_id,
+                    'p_days_back': days_back
+                }).execute()
+                
+                return result.data if result.data else aggregate_entry_stats([])
+                
+            except APIError as e:
+                if e.code != 'PGRST202':
+                    logger.error("Error getting entry stats: %s", e)
+                    return aggregate_entry_stats([])
+                logger.warning("get_user_entry_stats function not found - aggregating entries in Python")
+                self._stats_rpc_available = False
+                
+            except Exception as e:
+                logger.error("Error getting entry stats: %s", e)
+                return aggregate_entry_stats([])
+        
+        return aggregate_entry_stats(self.get_user_historical_entries(user_id, days_back))
+    
     def search_user_entries(self, user_id: str, search_query: Optional[str] = None,
                           start_date: Optional[str] = None, end_date: Optional[str] = None,
                           limit: int = 50) -> List[Dict[str, Any]]:
         """Search user entries"""
+        limit = max(1, min(limit, MAX_SEARCH_RESULTS))
         try:
+            # Without filters this is just "most recent entries", which the indexed
+            # table query answers without the RPC's full-text matching
+            if not (search_query or start_date or end_date):
+                result = self.client.table('entries').select(
+                    'entry_id,entry_text,created_at,analyses(emotions_quantified,topics)'
+                ).eq('user_id', user_id).order('created_at', desc=True).limit(limit).execute()
+                
+                results = []
+                for row in result.data or []:
+                    analyses = row.pop('analyses', None) or {}
+                    analysis = (analyses[0] if analyses else {}) if isinstance(analyses, list) else analyses
+                    row['emotions_quantified'] = analysis.get('emotions_quantified', {})
+                    row['topics'] = analysis.get('topics', [])
+                    # Nothing to rank against; 0.0 keeps the documented number type
+                    row['relevance_score'] = 0.0
+                    results.append(row)
+                return results
+            
             params = {
                 'p_user_id': user_id,
                 'p_search_query': search_query,
@@ -158,12 +461,67 @@ class SupabaseManager:
             return result.data if result.data else []
             
         except Exception as e:
-            logger.error(f"Error searching entries: {str(e)}")
+            logger.error("Error searching entries: %s", e)
             return []
     
+    def get_cached_llm_response(self, cache_key: str, max_age_seconds: int) -> Optional[str]:
+        """Look up a Gemini response cached by any instance within max_age_seconds"""
+        if not self._llm_cache_available:
+            return None
+        try:
+            cutoff = (datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)).isoformat()
+            result = self.cache_client.table('llm_cache').select('response_text').eq(
+                'cache_key', cache_key
+            ).gte('created_at', cutoff).limit(1).execute()
+            
+            return result.data[0]['response_text'] if result.data else None
+            
+        except Exception as e:
+            self._llm_cache_error("reading", e)
+            return None
+    
+    def store_llm_response(self, cache_key: str, response_text: str, max_age_seconds: int) -> bool:
+        """Cache a Gemini response for other instances, refreshing created_at
+        
+        At most once per LLM_CACHE_PRUNE_INTERVAL_SECONDS this also deletes rows
+        older than max_age_seconds, which lookups would ignore anyway.
+        """
+        if not self._llm_cache_available:
+            return False
+        try:
+            now = datetime.now(timezone.utc)
+            result = self.cache_client.table('llm_cache').upsert({
+                'cache_key': cache_key,
+                'response_text': response_text,
+                'created_at': now.isoformat()
+            }, on_conflict='cache_key').execute()
+            
+            if time.monotonic() - self._llm_cache_pruned_at >= LLM_CACHE_PRUNE_INTERVAL_SECONDS:
+                self._llm_cache_pruned_at = time.monotonic()
+                self.cache_client.table('llm_cache').delete().lt(
+                    'created_at', (now - timedelta(seconds=max_age_seconds)).isoformat()
+                ).execute()
+            
+            return bool(result.data)
+            
+        except Exception as e:
+            self._llm_cache_error("writing", e)
+            return False
+    
+    def _llm_cache_error(self, action: str, e: Exception) -> None:
+        """Log a failed llm_cache call, turning the cache off if the table is unusable"""
+        # PGRST205/42P01: the table doesn't exist; 42501: the key can't access it
+        if isinstance(e, APIError) and e.code in ('PGRST205', '42P01', '42501'):
+            logger.warning("llm_cache table unavailable - shared LLM cache disabled: %s", e)
+            self._llm_cache_available = False
+        else:
+            logger.warning("Error %s LLM cache: %s", action, e)
+    
     def _generate_tokens(self, user_id: str) -> Dict[str, str]:
         """Generate JWT tokens for user"""
         try:
+            now = datetime.now(timezone.utc)
+            
             # Create refresh token
             refresh_token = str(uuid.uuid4())
             
@@ -171,7 +529,7 @@ class SupabaseManager:
             session_data = {
                 'user_id': user_id,
                 'refresh_token': refresh_token,
-                'expires_at': (datetime.utcnow() + timedelta(days=30)).isoformat()
+                'expires_at': (now + timedelta(days=30)).isoformat()
             }
             
             self.client.table('user_sessions').insert(session_data).execute()
@@ -179,14 +537,14 @@ class SupabaseManager:
             # Generate JWT access token
             access_token_payload = {
                 'user_id': user_id,
-                'exp': datetime.utcnow() + timedelta(hours=24),
-                'iat': datetime.utcnow(),
+                'exp': int((now + timedelta(hours=24)).timestamp()),
+                'iat': int(now.timestamp()),
                 'type': 'access'
             }
             
             access_token = jwt.encode(
                 access_token_payload, 
-                os.getenv('JWT_SECRET', 'fallback-secret-key'), 
+                JWT_SECRET, 
                 algorithm='HS256'
             )
             
@@ -196,249 +554,791 @@ class SupabaseManager:
             }
             
         except Exception as e:
-            logger.error(f"Error generating tokens: {str(e)}")
+            logger.error("Error generating tokens: %s", e)
             return {}
 
+# Gemini models: the structured emotion extraction runs on the smaller, faster
+# model; the generative reflection and YSYM calls keep the full Flash model
+DEFAULT_MODEL = "gemini-2.5-flash"
+FAST_MODEL = "gemini-2.5-flash-lite"
+
+# Upper bound on the whole Gemini pipeline for one entry; keep it below the
+# serverless function's max duration so slow calls degrade instead of 504ing
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv('ANALYSIS_TIMEOUT_SECONDS', '25'))
+
+# Optional Gemini quota (requests and input tokens per minute) to pace calls
+# under; unset means no client-side limit
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', '0')) or None
+GEMINI_TPM = float(os.getenv('GEMINI_TPM', '0')) or None
+
+# How long Gemini responses stay reusable in the shared llm_cache table, and how
+# often each instance deletes rows past that age
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+LLM_CACHE_PRUNE_INTERVAL_SECONDS = 60 * 60
+# Longest a Gemini call waits on an llm_cache lookup before treating it as a miss
+LLM_CACHE_LOOKUP_TIMEOUT_SECONDS = 0.25
+
+# Prompt templates. The static instructions are sent as the system instruction
+# so every request shares an identical prefix that Gemini can cache; only the
+# short per-entry prompt changes between calls. Dedented so no indentation is
+# sent to Gemini.
+EMOTION_ANALYSIS_INSTRUCTIONS = """\
+You are an expert emotion and topic analyzer. Analyze the journal entry you are given and provide quantified emotions and topics.
+
+Guidelines:
+- emotions_quantified: List each specific emotion word with a decimal value; values sum to 1.0
+- emotion_polarity: Calculate the sum of positive vs negative emotions (must sum to 1.0)
+- For emotion_polarity, classify each emotion as positive or negative, then sum their values
+- emotions: Use words like happy, sad, anxious, calm, excited, proud, frustrated, overwhelmed, grateful, content, peaceful, stressed, hopeful, disappointed, etc.
+- topics: Use broad categories like family, work, exercise, relationships, health, travel, social, personal_growth, hobbies, finance, education, etc.
+- Ensure all emotion values are between 0 and 1 and sum to exactly 1.0
+- Be specific and accurate with emotions
+"""
+
+EMOTION_ANALYSIS_PROMPT = """\
+Text to analyze: "{entry_text}"
+"""
+
+GUEST_REFLECTION_INSTRUCTIONS = """\
+You are analyzing a journal entry for immediate insights. Provide a thoughtful reflection without referencing past patterns.
+
+**Guidelines for guest mode reflection:**
+- Focus on the current entry only
+- Provide general emotional insights
+- Be supportive and understanding
+- Don't mention historical patterns or past entries
+- Keep it encouraging and actionable
+- 2-3 sentences maximum
+
+**Example format:**
+"This entry reveals [insight about current emotions/situation]. [Observation about what might be driving these feelings]. [Gentle insight or perspective]."
+"""
+
+GUEST_REFLECTION_PROMPT = """\
+**Entry to analyze:** "{entry_text}"
+**Detected emotions:** {emotions_str}
+**Topics:** {topics_str}
+
+Generate a thoughtful reflection:
+"""
+
+# Guest mode has no history to wait for, so its analysis and reflection come
+# from a single structured call
+GUEST_ANALYSIS_INSTRUCTIONS = EMOTION_ANALYSIS_INSTRUCTIONS + """\
+- reflection: A reflection on the entry, written as described below
+
+""" + GUEST_REFLECTION_INSTRUCTIONS
+
+MINDWEAVE_REFLECTION_INSTRUCTIONS = """\
+You are a pattern recognition engine for MindWeave Reflections. Use historical data to identify behavioral and emotional patterns.
+
+**Tone Guidelines:**
+- Direct but not harsh
+- Observational, not prescriptive
+- State patterns, don't give advice
+- Mention specific numbers from history
+- Precise language - no fluff
+
+**Structure Formula:**
+1. Connect to historical pattern
+2. Reveal what this shows about behavior/thinking
+3. State the insight without judgment
+
+**Examples:**
+- "This is your 4th entry about presentation anxiety this month. Each time, the worry starts 2-3 days early despite past successes."
+- "You've mentioned feeling 'behind' in 7 of your last 12 entries, even when describing completed tasks."
+"""
+
+MINDWEAVE_REFLECTION_PROMPT = """\
+**Current entry:** "{entry_text}"
+**Current emotions:** {emotions_str}
+**Topics:** {topics_str}
+
+**Historical context (past 21 days):**
+{historical_summary}
+
+Generate a MindWeave reflection based on patterns:
+"""
+
+YSYM_INSTRUCTIONS = """\
+You are analyzing the gap between surface statements and underlying emotions for "You Said You Meant" feature.
+
+**Your task:** Reveal the deeper emotional truth behind what the person said.
+
+**Format:** "You said: [surface statement] → You meant: [deeper emotional truth]"
+
+**Common deeper patterns:**
+- Control fears: "I forgot to..." → "I'm afraid of losing control"
+- Abandonment fears: "They didn't respond" → "I'm afraid of being rejected"
+- Perfectionism: "I'm behind" → "My standards keep moving and I'll never be enough"
+- Inadequacy: "I failed at..." → "I'm fundamentally flawed"
+"""
+
+YSYM_PROMPT = """\
+**Context:**
+{context_str}
+
+Generate the YSYM analysis:
+"""
+
+def compact_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines so they don't cost prompt tokens"""
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+def normalize_distribution(values: Dict[str, float]) -> Dict[str, float]:
+    """Rescale values to sum to 1.0, leaving near-normalized or all-zero input as is"""
+    total = math.fsum(values.values())
+    if not total or abs(total - 1.0) <= 0.01:
+        return values
+    inv = 1.0 / total
+    return {k: v * inv for k, v in values.items()}
+
+# Bare check-ins carry too little signal to justify a Gemini round-trip. Exact
+# matches (after normalization) get a local analysis: (emotion, positive ratio).
+# Negative check-ins are deliberately absent so they still reach YSYM.
+TRIVIAL_ENTRIES: Dict[str, Tuple[str, float]] = {
+    "ok": ("neutral", 0.5),
+    "okay": ("neutral", 0.5),
+    "fine": ("calm", 0.6),
+    "not bad": ("calm", 0.6),
+    "good": ("content", 0.8),
+    "good day": ("content", 0.8),
+    "great": ("happy", 0.9),
+    "great day": ("happy", 0.9),
+    "test": ("neutral", 0.5),
+}
+
+TRIVIAL_REFLECTION = (
+    "Short check-ins still count. When you have a moment, write a few sentences "
+    "about what shaped your day for a deeper reflection."
+)
+
+class EmotionScore(BaseModel):
+    emotion: str
+    value: float
+
+class EmotionPolarity(BaseModel):
+    positive: float
+    negative: float
+
+class EmotionAnalysis(BaseModel):
+    """Response schema for the emotion and topic analysis call"""
+    emotions_quantified: List[EmotionScore]
+    emotion_polarity: EmotionPolarity
+    topics: List[str]
+
+class GuestAnalysis(EmotionAnalysis):
+    """Response schema for the combined guest-mode analysis and reflection call"""
+    reflection: str
+
+class ResponseCache:
+    """In-memory LRU cache with a per-entry TTL"""
+    
+    def __init__(self, max_size: int = 500, ttl: int = 30 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Build a cache key by hashing everything that determines the cached value"""
+        return hashlib.sha256("\x00".join(str(part) for part in parts).encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return a cached value, dropping it if its TTL has passed"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries on overflow"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+class TokenBucket:
+    """Paces outbound calls under a requests-per-minute and tokens-per-minute budget"""
+    
+    def __init__(self, rpm: float, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm) if tpm else 0.0
+        self._updated = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+    
+    async def acquire(self, estimated_tokens: int = 0) -> None:
+        """Wait until one request and estimated_tokens fit in the budget, then spend them"""
+        # All callers run on the shared event loop, so no lock is needed between
+        # checking and spending; a caller that must wait sleeps until the deficit refills
+        estimated_tokens = min(estimated_tokens, self.tpm) if self.tpm else 0
+        while True:
+            self._refill()
+            if self._requests >= 1 and self._tokens >= estimated_tokens:
+                self._requests -= 1
+                self._tokens -= estimated_tokens
+                return
+            
+            wait = (1 - self._requests) * 60 / self.rpm if self._requests < 1 else 0.0
+            if self.tpm and self._tokens < estimated_tokens:
+                wait = max(wait, (estimated_tokens - self._tokens) * 60 / self.tpm)
+            await asyncio.sleep(wait)
+
+class _InFlight:
+    """A shared Gemini call and the number of callers still waiting on it"""
+    __slots__ = ('task', 'waiters')
+    
+    def __init__(self, task: "asyncio.Future[str]"):
+        self.task = task
+        self.waiters = 0
+
 class GeminiAnalyzer:
     def __init__(self, api_key: str):
         if not api_key:
             raise ValueError("API key is required")
         os.environ['GEMINI_API_KEY'] = api_key
-        self.client = genai.Client()
+        # Keep-alive pool shared by the concurrent Gemini calls; it lives as long as
+        # the analyzer, so warm invocations skip the TCP/TLS handshake. Over HTTP/2
+        # the analysis, reflection and YSYM calls multiplex on one connection. Idle
+        # connections are kept past httpx's 5 s default so gaps between requests
+        # don't force a new handshake
+        pool_limits = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60)
+        self.client = genai.Client(http_options=types.HttpOptions(
+            timeout=30_000,  # milliseconds
+            client_args={'limits': pool_limits, 'http2': True},
+            async_client_args={'limits': pool_limits, 'http2': True},
+            # Transient 408/429/5xx responses are retried with jittered exponential
+            # backoff before a call gives up and its fallback is used; the pipeline
+            # deadline still bounds the total wait
+            retry_options=types.HttpRetryOptions(attempts=3, initial_delay=0.25, max_delay=4.0, jitter=0.25)
+        ))
+        self.cache = ResponseCache()
+        self._inflight: Dict[str, _InFlight] = {}
+        # Background llm_cache writes, referenced until done so they aren't collected
+        self._cache_writes: Set["asyncio.Task[bool]"] = set()
+        # Optional client-side pacing, so bursts queue briefly instead of failing with 429s
+        self.rate_limiter = TokenBucket(GEMINI_RPM, GEMINI_TPM) if GEMINI_RPM else None
         logger.info("Gemini API client initialized successfully")
     
-    def analyze_emotions_and_topics(self, entry_text: str) -> Dict[str, Any]:
-        """First Gemini API call: Analyze emotions, topics, and quantify emotions"""
-        prompt = f"""
-        You are an expert emotion and topic analyzer. Analyze the following journal entry and provide quantified emotions and topics.
-        
-        Text to analyze: "{entry_text}"
-        
-        Please respond in the following JSON format:
-        {{
-            "emotions_quantified": {{"emotion1": 0.4, "emotion2": 0.6}},
-            "emotion_polarity": {{"positive": 0.4, "negative": 0.6}},
-            "topics": ["topic1", "topic2"]
-        }}
-        
-        Guidelines:
-        - emotions_quantified: Use specific emotion words with decimal values that sum to 1.0
-        - emotion_polarity: Calculate the sum of positive vs negative emotions (must sum to 1.0)
-        - For emotion_polarity, classify each emotion as positive or negative, then sum their values
-        - emotions: Use words like happy, sad, anxious, calm, excited, proud, frustrated, overwhelmed, grateful, content, peaceful, stressed, hopeful, disappointed, etc.
-        - topics: Use broad categories like family, work, exercise, relationships, health, travel, social, personal_growth, hobbies, finance, education, etc.
-        - Ensure all emotion values are between 0 and 1 and sum to exactly 1.0
-        - Be specific and accurate with emotions
+    async def _cache_lookup(self, cache_key: str, shared: bool = True) -> Optional[str]:
+        """Check the in-process cache, then (if shared) the Supabase llm_cache table"""
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        db = get_supabase()
+        if not shared or not db:
+            return None
+        try:
+            # Every miss waits on this lookup, so a slow database mustn't slow Gemini
+            # calls down; the thread finishes in the background either way
+            cached = await asyncio.wait_for(
+                asyncio.to_thread(db.get_cached_llm_response, cache_key, LLM_CACHE_TTL_SECONDS),
+                LLM_CACHE_LOOKUP_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("LLM cache lookup timed out, treating it as a miss")
+            return None
+        if cached is not None:
+            self.cache.set(cache_key, cached)
+        return cached
+    
+    def _cache_store(self, cache_key: str, response_text: str, shared: bool = True) -> None:
+        """Write a response to the in-process cache and, if shared, to llm_cache
+        
+        Guest responses are never shared, so guest entries don't reach the database.
         """
+        self.cache.set(cache_key, response_text)
+        db = get_supabase()
+        if shared and db:
+            # Not awaited: the caller already has the response, so the write stays
+            # off the request path
+            write = asyncio.ensure_future(
+                asyncio.to_thread(db.store_llm_response, cache_key, response_text, LLM_CACHE_TTL_SECONDS)
+            )
+            self._cache_writes.add(write)
+            write.add_done_callback(self._cache_writes.discard)
+    
+    async def _cached_generate(self, prompt: str, temperature: float, model: str = DEFAULT_MODEL,
+                               shared: bool = True, **config_options: Any) -> str:
+        """Return the response text for a prompt, calling Gemini only on a cache miss"""
+        # The key covers everything that shapes the output, so identical requests
+        # from any instance share one Gemini call
+        cache_key = ResponseCache.make_key(model, temperature, config_options.get('system_instruction', ''), prompt)
+        
+        # Concurrent callers with the same key share one lookup and one Gemini call
+        flight = self._inflight.get(cache_key)
+        if flight is None:
+            flight = self._inflight[cache_key] = _InFlight(asyncio.ensure_future(
+                self._lookup_or_generate(cache_key, prompt, temperature, model, shared, **config_options)
+            ))
+            flight.task.add_done_callback(
+                lambda _: self._inflight.pop(cache_key) if self._inflight.get(cache_key) is flight else None
+            )
         
+        flight.waiters += 1
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.3,
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                )
+            # Shielded so one cancelled caller (e.g. a discarded speculative YSYM)
+            # doesn't cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Unregistered first, so a caller arriving before the cancellation
+                # lands starts a new call instead of joining the cancelled one
+                if self._inflight.get(cache_key) is flight:
+                    del self._inflight[cache_key]
+                flight.task.cancel()
+    
+    async def _lookup_or_generate(self, cache_key: str, prompt: str, temperature: float, model: str,
+                                  shared: bool, **config_options: Any) -> str:
+        """Cache lookup, then the Gemini call on a miss; run once per in-flight key"""
+        cached = await self._cache_lookup(cache_key, shared)
+        if cached is not None:
+            return cached
+        
+        response = await self._agen(prompt, temperature, model, **config_options)
+        response_text = (response.text or "").strip()
+        if response_text:
+            self._cache_store(cache_key, response_text, shared)
+        return response_text
+    
+    async def _throttle(self, prompt: str, system_instruction: Optional[str] = None) -> None:
+        """Wait for room in the rate limit, estimating ~4 characters per token"""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire((len(prompt) + len(system_instruction or "")) // 4)
+    
+    async def _agen(self, prompt: str, temperature: float, model: str = DEFAULT_MODEL,
+                    **config_options: Any) -> types.GenerateContentResponse:
+        """Send a prompt through the async Gemini client"""
+        await self._throttle(prompt, config_options.get('system_instruction'))
+        return await self.client.aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                temperature=temperature,
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+                **config_options
             )
-            
-            response_text = response.text.strip()
-            logger.info(f"Raw emotion analysis response: {response_text}")
-            
-            # Parse JSON response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                parsed_response = json.loads(json_str)
+        )
+    
+    async def _analyze_with_speculative_ysym(self, entry_text: str, with_reflection: bool = False,
+                                             is_guest_mode: bool = False
+                                             ) -> Tuple[Dict[str, Any], Optional[str], bool, "asyncio.Task[str]"]:
+        """Run the emotion analysis while YSYM is generated speculatively
+        
+        With with_reflection the guest reflection comes from the same call;
+        otherwise the returned reflection is None.
+        """
+        # YSYM only needs the entry text, so it runs alongside the analysis and is
+        # discarded if the entry turns out not to be negative enough
+        ysym_task = asyncio.create_task(self.generate_ysym_analysis(entry_text, is_guest_mode=is_guest_mode))
+        
+        try:
+            if with_reflection:
+                analysis_result, reflection = await self.analyze_and_reflect(entry_text)
+            else:
+                analysis_result, reflection = await self.analyze_emotions_and_topics(entry_text, is_guest_mode), None
+        except BaseException:
+            ysym_task.cancel()
+            raise
+        
+        negative_ratio = analysis_result.get('emotion_polarity', {}).get('negative', 0)
+        ysym_triggered = negative_ratio >= YSYM_THRESHOLD
+        if not ysym_triggered:
+            ysym_task.cancel()
+        
+        return analysis_result, reflection, ysym_triggered, ysym_task
+    
+    @staticmethod
+    async def _resolve_history(historical_stats: HistorySource) -> Optional[Dict[str, Any]]:
+        """Wait for historical stats that are still being fetched"""
+        if isinstance(historical_stats, concurrent.futures.Future):
+            # Shielded so a pipeline timeout doesn't cancel the fetch the caller also reads
+            try:
+                return await asyncio.shield(asyncio.wrap_future(historical_stats))
+            except Exception:
+                return None
+        return historical_stats
+    
+    async def _reflect(self, entry_text: str, analysis_result: Dict[str, Any],
+                       historical_stats: HistorySource, is_guest_mode: bool) -> str:
+        """Generate the MindWeave reflection once the historical stats are available"""
+        return await self.generate_mindweave_reflection(
+            entry_text, analysis_result, await self._resolve_history(historical_stats), is_guest_mode
+        )
+    
+    async def run_reflection_pipeline(self, entry_text: str, historical_stats: HistorySource = None,
+                                      is_guest_mode: bool = False) -> Tuple[Dict[str, Any], str, bool, Optional[str]]:
+        """Run analysis, then the MindWeave reflection, with YSYM started speculatively
+        
+        Guest mode gets the reflection from the analysis call itself.
+        """
+        trivial_analysis = self._trivial_analysis(entry_text)
+        if trivial_analysis is not None:
+            return trivial_analysis, TRIVIAL_REFLECTION, False, None
+        
+        # Everything has to finish within ANALYSIS_TIMEOUT_SECONDS so the request
+        # returns before the platform kills it; late pieces are replaced by fallbacks
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ANALYSIS_TIMEOUT_SECONDS
+        
+        try:
+            analysis_result, mindweave_reflection, ysym_triggered, ysym_task = await asyncio.wait_for(
+                self._analyze_with_speculative_ysym(entry_text, with_reflection=is_guest_mode, is_guest_mode=is_guest_mode),
+                ANALYSIS_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Emotion analysis exceeded the pipeline deadline, using fallbacks")
+            return self._fallback_analysis(entry_text), self._reflection_fallback(is_guest_mode), False, None
+        
+        # A reflection built on the placeholder analysis is meaningless, so skip the call
+        if analysis_result.get('fallback_used'):
+            return analysis_result, self._reflection_fallback(is_guest_mode), ysym_triggered, None
+        
+        pending = {ysym_task} if ysym_triggered else set()
+        reflection_task = None
+        if mindweave_reflection is None:
+            reflection_task = asyncio.create_task(self._reflect(
+                entry_text, analysis_result, historical_stats, is_guest_mode
+            ))
+            pending.add(reflection_task)
+        if pending:
+            await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()))
+        
+        if reflection_task is not None:
+            if reflection_task.done():
+                mindweave_reflection = reflection_task.result()
+            else:
+                reflection_task.cancel()
+                logger.warning("MindWeave reflection exceeded the pipeline deadline")
+                mindweave_reflection = self._reflection_fallback(is_guest_mode)
+        
+        ysym_analysis = None
+        if ysym_triggered:
+            if ysym_task.done():
+                ysym_analysis = ysym_task.result()
+            else:
+                ysym_task.cancel()
+                logger.warning("YSYM analysis exceeded the pipeline deadline")
+                ysym_analysis = self._ysym_fallback()
+        
+        return analysis_result, mindweave_reflection, ysym_triggered, ysym_analysis
+    
+    async def stream_reflection_pipeline(self, entry_text: str, historical_stats: HistorySource = None,
+                                         is_guest_mode: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Same as run_reflection_pipeline, but yields events as soon as each piece is ready"""
+        trivial_analysis = self._trivial_analysis(entry_text)
+        if trivial_analysis is not None:
+            yield {'type': 'analysis', 'analysis': trivial_analysis, 'ysym': False}
+            yield {'type': 'reflection_delta', 'text': TRIVIAL_REFLECTION}
+            yield {'type': 'reflection_complete', 'mindweave_reflection': TRIVIAL_REFLECTION, 'ysym_analysis': None}
+            return
+        
+        # Bound by the same deadline as run_reflection_pipeline; each step waits only
+        # for the time left, and late pieces are replaced by fallbacks
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ANALYSIS_TIMEOUT_SECONDS
+        
+        def remaining() -> float:
+            return max(0.0, deadline - loop.time())
+        
+        # The reflection is streamed separately, so it isn't folded into the analysis call
+        try:
+            analysis_result, _, ysym_triggered, ysym_task = await asyncio.wait_for(
+                self._analyze_with_speculative_ysym(entry_text, is_guest_mode=is_guest_mode),
+                ANALYSIS_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Emotion analysis exceeded the pipeline deadline, using fallbacks")
+            analysis_result, ysym_triggered, ysym_task = self._fallback_analysis(entry_text), False, None
+        yield {'type': 'analysis', 'analysis': analysis_result, 'ysym': ysym_triggered}
+        
+        chunks = []
+        if not analysis_result.get('fallback_used'):
+            reflection = None
+            try:
+                historical_stats = await asyncio.wait_for(self._resolve_history(historical_stats), remaining())
+                reflection = self.stream_mindweave_reflection(entry_text, analysis_result, historical_stats, is_guest_mode)
+                while True:
+                    text = await asyncio.wait_for(reflection.__anext__(), remaining())
+                    chunks.append(text)
+                    yield {'type': 'reflection_delta', 'text': text}
+            except StopAsyncIteration:
+                pass
+            except asyncio.TimeoutError:
+                logger.warning("MindWeave reflection exceeded the pipeline deadline")
+            except BaseException:
+                if ysym_task is not None:
+                    ysym_task.cancel()
+                raise
+            finally:
+                if reflection is not None:
+                    await reflection.aclose()
+        
+        # Text already sent stays; the fallback only fills an empty reflection
+        if not chunks:
+            chunks.append(self._reflection_fallback(is_guest_mode))
+            yield {'type': 'reflection_delta', 'text': chunks[0]}
+        
+        ysym_analysis = None
+        if ysym_triggered:
+            await asyncio.wait({ysym_task}, timeout=remaining())
+            if ysym_task.done():
+                ysym_analysis = ysym_task.result()
             else:
-                parsed_response = json.loads(response_text)
+                ysym_task.cancel()
+                logger.warning("YSYM analysis exceeded the pipeline deadline")
+                ysym_analysis = self._ysym_fallback()
+        
+        yield {
+            'type': 'reflection_complete',
+            'mindweave_reflection': "".join(chunks).strip(),
+            'ysym_analysis': ysym_analysis
+        }
+    
+    async def analyze_emotions_and_topics(self, entry_text: str, is_guest_mode: bool = False) -> Dict[str, Any]:
+        """First Gemini API call: Analyze emotions, topics, and quantify emotions"""
+        prompt = EMOTION_ANALYSIS_PROMPT.format(entry_text=compact_whitespace(entry_text))
+        
+        try:
+            response_text = await self._cached_generate(
+                prompt,
+                temperature=0.3,
+                model=FAST_MODEL,
+                shared=not is_guest_mode,
+                system_instruction=EMOTION_ANALYSIS_INSTRUCTIONS,
+                response_mime_type="application/json",
+                response_schema=EmotionAnalysis
+            )
             
-            emotions_quantified = parsed_response.get('emotions_quantified', {})
-            emotion_polarity = parsed_response.get('emotion_polarity', {})
-            topics = parsed_response.get('topics', [])
+            logger.info("Raw emotion analysis response: %s", response_text)
             
-            # Validate and normalize emotions
-            total_emotions = sum(emotions_quantified.values())
-            if abs(total_emotions - 1.0) > 0.01:
-                emotions_quantified = {k: v/total_emotions for k, v in emotions_quantified.items()}
+            # Gemini is constrained to the schema; cached text is validated the same way
+            return self._analysis_result(entry_text, EmotionAnalysis.model_validate_json(response_text))
             
-            # Validate and normalize polarity
-            total_polarity = sum(emotion_polarity.values())
-            if abs(total_polarity - 1.0) > 0.01:
-                emotion_polarity = {k: v/total_polarity for k, v in emotion_polarity.items()}
+        except Exception as e:
+            logger.error("Error in analysis: %s", e)
+            return self._fallback_analysis(entry_text)
+    
+    async def analyze_and_reflect(self, entry_text: str) -> Tuple[Dict[str, Any], str]:
+        """Guest mode: emotion analysis and reflection from a single Gemini call"""
+        prompt = EMOTION_ANALYSIS_PROMPT.format(entry_text=compact_whitespace(entry_text))
+        
+        try:
+            # The full model, since the same call writes the reflection
+            response_text = await self._cached_generate(
+                prompt,
+                temperature=0.3,
+                shared=False,
+                system_instruction=GUEST_ANALYSIS_INSTRUCTIONS,
+                response_mime_type="application/json",
+                response_schema=GuestAnalysis
+            )
             
-            return {
-                'entry_text': entry_text,
-                'emotions_quantified': emotions_quantified,
-                'emotion_polarity': emotion_polarity,
-                'topics': topics[:3],
-                'timestamp': datetime.now().isoformat()
-            }
+            logger.info("Raw guest analysis response: %s", response_text)
+            
+            parsed_response = GuestAnalysis.model_validate_json(response_text)
+            reflection = parsed_response.reflection.strip() or self._reflection_fallback(True)
+            return self._analysis_result(entry_text, parsed_response), reflection
             
         except Exception as e:
-            logger.error(f"Error in analysis: {str(e)}")
-            return self._fallback_analysis(entry_text)
+            logger.error("Error in guest analysis: %s", e)
+            return self._fallback_analysis(entry_text), self._reflection_fallback(True)
     
-    def generate_mindweave_reflection(self, entry_text: str, analysis_result: Dict[str, Any], 
-                                    historical_entries: List[Dict[str, Any]] = None, 
-                                    is_guest_mode: bool = False) -> str:
-        """Second Gemini API call: Generate MindWeave reflection"""
+    @staticmethod
+    def _analysis_result(entry_text: str, parsed_response: EmotionAnalysis) -> Dict[str, Any]:
+        """Convert a validated analysis response into the API's analysis dict"""
+        emotions_quantified = {item.emotion: item.value for item in parsed_response.emotions_quantified}
+        emotion_polarity = parsed_response.emotion_polarity.model_dump()
+        
+        return {
+            'entry_text': entry_text,
+            'emotions_quantified': normalize_distribution(emotions_quantified),
+            'emotion_polarity': normalize_distribution(emotion_polarity),
+            'topics': parsed_response.topics[:3],
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+    
+    def _build_reflection_prompt(self, entry_text: str, analysis_result: Dict[str, Any],
+                                 historical_stats: Optional[Dict[str, Any]],
+                                 is_guest_mode: bool) -> Tuple[str, str]:
+        """Build the MindWeave prompt and system instructions for either mode"""
         emotions_str = ", ".join([f"{emotion}: {value:.2f}" for emotion, value in analysis_result.get('emotions_quantified', {}).items()])
         topics_str = ", ".join(analysis_result.get('topics', []))
         
         # Different prompts for guest vs user mode
-        if is_guest_mode or not historical_entries:
+        if is_guest_mode or not historical_stats or not historical_stats.get('entry_count'):
             # Guest mode: simplified reflection without historical context
-            prompt = f"""
-            You are analyzing a journal entry for immediate insights. Provide a thoughtful reflection without referencing past patterns.
-
-            **Entry to analyze:** "{entry_text}"
-            **Detected emotions:** {emotions_str}
-            **Topics:** {topics_str}
-
-            **Guidelines for guest mode reflection:**
-            - Focus on the current entry only
-            - Provide general emotional insights
-            - Be supportive and understanding
-            - Don't mention historical patterns or past entries
-            - Keep it encouraging and actionable
-            - 2-3 sentences maximum
-
-            **Example format:**
-            "This entry reveals [insight about current emotions/situation]. [Observation about what might be driving these feelings]. [Gentle insight or perspective]."
-
-            Generate a thoughtful reflection:
-            """
-        else:
-            # User mode: full MindWeave with historical context
-            historical_summary = self._create_historical_summary(historical_entries)
-            
-            prompt = f"""
-            You are a pattern recognition engine for MindWeave Reflections. Use historical data to identify behavioral and emotional patterns.
-
-            **Current entry:** "{entry_text}"
-            **Current emotions:** {emotions_str}
-            **Topics:** {topics_str}
-
-            **Historical context (past 21 days):**
-            {historical_summary}
-
-            **Tone Guidelines:**
-            - Direct but not harsh
-            - Observational, not prescriptive
-            - State patterns, don't give advice
-            - Mention specific numbers from history
-            - Precise language - no fluff
-
-            **Structure Formula:**
-            1. Connect to historical pattern
-            2. Reveal what this shows about behavior/thinking
-            3. State the insight without judgment
-
-            **Examples:**
-            - "This is your 4th entry about presentation anxiety this month. Each time, the worry starts 2-3 days early despite past successes."
-            - "You've mentioned feeling 'behind' in 7 of your last 12 entries, even when describing completed tasks."
-
-            Generate a MindWeave reflection based on patterns:
-            """
+            prompt = GUEST_REFLECTION_PROMPT.format(
+                entry_text=compact_whitespace(entry_text),
+                emotions_str=emotions_str,
+                topics_str=topics_str
+            )
+            return prompt, GUEST_REFLECTION_INSTRUCTIONS
+        
+        # User mode: full MindWeave with historical context
+        historical_summary = self._create_historical_summary(historical_stats)
         
+        prompt = MINDWEAVE_REFLECTION_PROMPT.format(
+            entry_text=compact_whitespace(entry_text),
+            emotions_str=emotions_str,
+            topics_str=topics_str,
+            historical_summary=historical_summary
+        )
+        return prompt, MINDWEAVE_REFLECTION_INSTRUCTIONS
+    
+    def _reflection_fallback(self, is_guest_mode: bool) -> str:
+        """Canned reflection used when the Gemini call fails"""
+        if is_guest_mode:
+            return "Your entry shows meaningful emotional awareness. Consider tracking your patterns over time for deeper insights."
+        return "Pattern analysis temporarily unavailable. Your entry has been recorded for future insights."
+    
+    async def generate_mindweave_reflection(self, entry_text: str, analysis_result: Dict[str, Any], 
+                                    historical_stats: Optional[Dict[str, Any]] = None, 
+                                    is_guest_mode: bool = False) -> str:
+        """Second Gemini API call: Generate MindWeave reflection"""
+        prompt, instructions = self._build_reflection_prompt(entry_text, analysis_result, historical_stats, is_guest_mode)
+        
+        try:
+            return await self._cached_generate(
+                prompt, temperature=0.3, shared=not is_guest_mode, system_instruction=instructions
+            )
+            
+        except Exception as e:
+            logger.error("Error in MindWeave reflection: %s", e)
+            return self._reflection_fallback(is_guest_mode)
+    
+    async def stream_mindweave_reflection(self, entry_text: str, analysis_result: Dict[str, Any],
+                                          historical_stats: Optional[Dict[str, Any]] = None,
+                                          is_guest_mode: bool = False) -> AsyncIterator[str]:
+        """Streaming variant of generate_mindweave_reflection, yielding text chunks"""
+        prompt, instructions = self._build_reflection_prompt(entry_text, analysis_result, historical_stats, is_guest_mode)
+        
+        # Shares cache entries with generate_mindweave_reflection
+        cache_key = ResponseCache.make_key(DEFAULT_MODEL, 0.3, instructions, prompt)
+        cached = await self._cache_lookup(cache_key, shared=not is_guest_mode)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
+            await self._throttle(prompt, instructions)
+            stream = await self.client.aio.models.generate_content_stream(
+                model=DEFAULT_MODEL,
                 contents=prompt,
                 config=types.GenerateContentConfig(
                     temperature=0.3,
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
+                    thinking_config=types.ThinkingConfig(thinking_budget=0),
+                    system_instruction=instructions
                 )
             )
-            return response.text.strip()
+            async for chunk in stream:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
             
         except Exception as e:
-            logger.error(f"Error in MindWeave reflection: {str(e)}")
-            if is_guest_mode:
-                return "Your entry shows meaningful emotional awareness. Consider tracking your patterns over time for deeper insights."
-            else:
-                return "Pattern analysis temporarily unavailable. Your entry has been recorded for future insights."
+            logger.error("Error in streamed MindWeave reflection: %s", e)
+            # Only substitute the fallback if nothing has reached the client yet
+            if not chunks:
+                yield self._reflection_fallback(is_guest_mode)
+            return
+        
+        reflection = "".join(chunks).strip()
+        if reflection:
+            self._cache_store(cache_key, reflection, shared=not is_guest_mode)
     
-    def generate_ysym_analysis(self, entry_text: str, analysis_result: Dict[str, Any]) -> str:
+    async def generate_ysym_analysis(self, entry_text: str, analysis_result: Optional[Dict[str, Any]] = None,
+                                     is_guest_mode: bool = False) -> str:
         """Third Gemini API call: YSYM analysis (same for both modes)"""
-        emotions_str = ", ".join([f"{emotion}: {value:.2f}" for emotion, value in analysis_result.get('emotions_quantified', {}).items()])
-        negative_percentage = analysis_result.get('emotion_polarity', {}).get('negative', 0) * 100
-        
-        prompt = f"""
-        You are analyzing the gap between surface statements and underlying emotions for "You Said You Meant" feature.
-        
-        **Context:**
-        - Entry: "{entry_text}"
-        - Emotions: {emotions_str}
-        - Negative emotion level: {negative_percentage:.1f}% (triggered because ≥60%)
-        
-        **Your task:** Reveal the deeper emotional truth behind what the person said.
-        
-        **Format:** "You said: [surface statement] → You meant: [deeper emotional truth]"
+        # Without an analysis result (speculative call) the prompt relies on the entry text alone
+        context_lines = [f'- Entry: "{compact_whitespace(entry_text)}"']
+        if analysis_result:
+            emotions_str = ", ".join([f"{emotion}: {value:.2f}" for emotion, value in analysis_result.get('emotions_quantified', {}).items()])
+            negative_percentage = analysis_result.get('emotion_polarity', {}).get('negative', 0) * 100
+            context_lines.append(f"- Emotions: {emotions_str}")
+            context_lines.append(f"- Negative emotion level: {negative_percentage:.1f}% (triggered because ≥60%)")
+        context_str = "\n".join(context_lines)
         
-        **Common deeper patterns:**
-        - Control fears: "I forgot to..." → "I'm afraid of losing control"
-        - Abandonment fears: "They didn't respond" → "I'm afraid of being rejected"
-        - Perfectionism: "I'm behind" → "My standards keep moving and I'll never be enough"
-        - Inadequacy: "I failed at..." → "I'm fundamentally flawed"
-        
-        Generate the YSYM analysis:
-        """
+        prompt = YSYM_PROMPT.format(context_str=context_str)
         
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.4,
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                )
+            return await self._cached_generate(
+                prompt, temperature=0.4, shared=not is_guest_mode, system_instruction=YSYM_INSTRUCTIONS
             )
-            return response.text.strip()
             
         except Exception as e:
-            logger.error(f"Error in YSYM analysis: {str(e)}")
-            return "Deep analysis temporarily unavailable. Your patterns suggest underlying emotional needs worth exploring."
+            logger.error("Error in YSYM analysis: %s", e)
+            return self._ysym_fallback()
+    
+    def _ysym_fallback(self) -> str:
+        """Canned YSYM text used when the Gemini call fails or runs out of time"""
+        return "Deep analysis temporarily unavailable. Your patterns suggest underlying emotional needs worth exploring."
     
-    def _create_historical_summary(self, historical_entries: List[Dict[str, Any]]) -> str:
+    def _create_historical_summary(self, historical_stats: Optional[Dict[str, Any]]) -> str:
         """Create a summary of historical entries for context"""
-        if not historical_entries:
+        if not historical_stats or not historical_stats.get('entry_count'):
             return "No historical entries available."
         
         summary_parts = []
         
         # Count entries
-        summary_parts.append(f"Total entries in past 21 days: {len(historical_entries)}")
+        summary_parts.append(f"Total entries in past 21 days: {historical_stats['entry_count']}")
         
-        # Extract emotion patterns
-        all_emotions = {}
-        all_topics = []
-        
-        for entry in historical_entries:
-            if entry.get('emotions_quantified'):
-                for emotion, value in entry['emotions_quantified'].items():
-                    all_emotions[emotion] = all_emotions.get(emotion, 0) + value
-            
-            if entry.get('topics'):
-                all_topics.extend(entry['topics'])
+        all_emotions = Counter(historical_stats.get('emotion_sums') or {})
+        topic_counts = Counter(historical_stats.get('topic_counts') or {})
         
         # Top emotions
         if all_emotions:
-            top_emotions = sorted(all_emotions.items(), key=lambda x: x[1], reverse=True)[:3]
+            top_emotions = all_emotions.most_common(3)
             emotions_summary = ", ".join([f"{emotion} ({count:.1f})" for emotion, count in top_emotions])
             summary_parts.append(f"Most frequent emotions: {emotions_summary}")
         
         # Top topics
-        if all_topics:
-            topic_counts = {}
-            for topic in all_topics:
-                topic_counts[topic] = topic_counts.get(topic, 0) + 1
-            top_topics = sorted(topic_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+        if topic_counts:
+            top_topics = topic_counts.most_common(3)
             topics_summary = ", ".join([f"{topic} ({count})" for topic, count in top_topics])
             summary_parts.append(f"Most frequent topics: {topics_summary}")
         
         return " | ".join(summary_parts)
     
+    def is_trivial_entry(self, entry_text: str) -> bool:
+        """Whether the entry is a bare check-in answered without Gemini"""
+        return self._trivial_analysis(entry_text) is not None
+    
+    def _trivial_analysis(self, entry_text: str) -> Optional[Dict[str, Any]]:
+        """Local analysis for bare check-ins like "ok" or "great day", None otherwise"""
+        match = TRIVIAL_ENTRIES.get(entry_text.strip().lower().rstrip('.!~ '))
+        if match is None:
+            return None
+        emotion, positive = match
+        return {
+            'entry_text': entry_text,
+            'emotions_quantified': {emotion: 1.0},
+            'emotion_polarity': {"positive": positive, "negative": round(1.0 - positive, 2)},
+            'topics': ["check-in"],
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+    
     def _fallback_analysis(self, entry_text: str) -> Dict[str, Any]:
         """Fallback analysis when API calls fail"""
         return {
@@ -446,29 +1346,46 @@ class GeminiAnalyzer:
             'emotions_quantified': {"neutral": 1.0},
             'emotion_polarity': {"positive": 0.5, "negative": 0.5},
             'topics': ["general"],
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'fallback_used': True
         }
 
-def get_analyzer():
-    global analyzer
-    if analyzer is None:
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        analyzer = GeminiAnalyzer(api_key)
-    return analyzer
-
-def get_supabase():
-    global supabase
-    if supabase is None:
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_ANON_KEY')
-        if not url or not key:
-            logger.warning("Supabase credentials not found - running in guest-only mode")
-            return None
-        supabase = SupabaseManager(url, key)
+# Created at import so client setup happens during cold start, not in the first request
+analyzer: Optional[GeminiAnalyzer] = GeminiAnalyzer(GEMINI_API_KEY) if GEMINI_API_KEY else None
+if analyzer is None:
+    logger.warning("GEMINI_API_KEY not set - analysis endpoints are unavailable")
+
+def _create_supabase() -> Optional[SupabaseManager]:
+    if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+        logger.warning("Supabase credentials not found - running in guest-only mode")
+        return None
+    try:
+        return SupabaseManager(SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY)
+    except Exception as e:
+        logger.error("Could not initialize Supabase client: %s", e)
+        return None
+
+# Also created at import (no network traffic until the first query), so requests
+# only read the module global; None means guest-only mode
+supabase: Optional[SupabaseManager] = _create_supabase()
+
+def get_supabase() -> Optional[SupabaseManager]:
     return supabase
 
+# Verified access token payloads, so repeat requests with the same token skip
+# signature verification; expiry is still checked on every hit
+_token_cache = ResponseCache(max_size=4096, ttl=5 * 60)
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """Verify a JWT access token, reusing the payload of recently verified tokens"""
+    payload = _token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        _token_cache.set(token, payload)
+    elif 'exp' in payload and payload['exp'] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
 def require_auth(f):
     """Decorator to require authentication"""
     @wraps(f)
@@ -479,7 +1396,7 @@ def require_auth(f):
         
         token = auth_header.split(' ')[1]
         try:
-            payload = jwt.decode(token, os.getenv('JWT_SECRET', 'fallback-secret-key'), algorithms=['HS256'])
+            payload = decode_access_token(token)
             request.user_id = payload['user_id']
             return f(*args, **kwargs)
         except jwt.ExpiredSignatureError:
@@ -491,178 +1408,192 @@ def require_auth(f):
 
 # Routes
 # 更新 main.py 中的主頁路由
-@app.route('/')
-def home():
-    return jsonify({
-        "service": "MindWeave Reflection Backend API",
-        "version": "0.2.0",
-        "status": "production",
-        "author": "Gary Yang (gary@agryyang.in)",
-        "repository": "https://github.com/Gary0302/Mind_BE",
-        "documentation": {
-            "quick_start": {
-                "health_check": "GET /api/health",
-                "guest_analysis": "POST /api/analyze",
-                "user_registration": "POST /api/auth/register"
-            },
-            "authentication": {
-                "register": {
-                    "method": "POST",
-                    "endpoint": "/api/auth/register",
-                    "body": {
-                        "email": "user@example.com (optional)",
-                        "username": "username123 (optional, at least one required)"
-                    },
-                    "response": {
-                        "user": "User object with user_id, email, username, etc.",
-                        "tokens": {
-                            "access_token": "JWT token for authenticated requests",
-                            "refresh_token": "Token for refreshing access token"
-                        }
-                    }
+# Service documentation served by home(); it never changes at runtime, so it is
+# encoded once at import instead of on every request
+HOME_DOCUMENTATION: Dict[str, Any] = {
+    "service": "MindWeave Reflection Backend API",
+    "version": "0.2.0",
+    "status": "production",
+    "author": "Gary Yang (gary@agryyang.in)",
+    "repository": "https://github.com/Gary0302/Mind_BE",
+    "documentation": {
+        "quick_start": {
+            "health_check": "GET /api/health",
+            "guest_analysis": "POST /api/analyze",
+            "user_registration": "POST /api/auth/register"
+        },
+        "authentication": {
+            "register": {
+                "method": "POST",
+                "endpoint": "/api/auth/register",
+                "body": {
+                    "email": "user@example.com (optional)",
+                    "username": "username123 (optional, at least one required)"
                 },
-                "login": {
-                    "method": "POST", 
-                    "endpoint": "/api/auth/login",
-                    "body": {"email": "user@example.com"},
-                    "response": "Same format as registration"
+                "response": {
+                    "user": "User object with user_id, email, username, etc.",
+                    "tokens": {
+                        "access_token": "JWT token for authenticated requests",
+                        "refresh_token": "Token for refreshing access token"
+                    }
                 }
             },
-            "analysis": {
-                "guest_mode": {
-                    "method": "POST",
-                    "endpoint": "/api/analyze",
-                    "headers": {"Content-Type": "application/json"},
-                    "body": {"entry_text": "Your journal entry (max 5000 chars)"},
-                    "response": {
-                        "analysis": "Emotion quantification and topics",
-                        "mindweave_reflection": "AI-generated insight",
-                        "ysym": "Boolean - triggers when negative emotions >= 60%",
-                        "ysym_analysis": "Deeper emotional analysis (if triggered)",
-                        "mode": "guest",
-                        "stored": False
-                    }
-                },
-                "user_mode": {
-                    "method": "POST",
-                    "endpoint": "/api/analyze", 
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Authorization": "Bearer your_access_token"
-                    },
-                    "body": {
-                        "entry_text": "Your journal entry",
-                        "user_id": "your_user_id"
-                    },
-                    "response": {
-                        "analysis": "Same as guest mode",
-                        "mindweave_reflection": "Enhanced with historical context",
-                        "mode": "user",
-                        "stored": True,
-                        "historical_entries_used": "Number of past entries analyzed"
-                    }
+            "login": {
+                "method": "POST", 
+                "endpoint": "/api/auth/login",
+                "body": {"email": "user@example.com"},
+                "response": "Same format as registration"
+            }
+        },
+        "analysis": {
+            "guest_mode": {
+                "method": "POST",
+                "endpoint": "/api/analyze",
+                "headers": {"Content-Type": "application/json"},
+                "body": {"entry_text": "Your journal entry (max 5000 chars)"},
+                "response": {
+                    "analysis": "Emotion quantification and topics",
+                    "mindweave_reflection": "AI-generated insight",
+                    "ysym": "Boolean - triggers when negative emotions >= 60%",
+                    "ysym_analysis": "Deeper emotional analysis (if triggered)",
+                    "mode": "guest",
+                    "stored": False
                 }
             },
-            "search": {
+            "user_mode": {
                 "method": "POST",
-                "endpoint": "/api/search",
+                "endpoint": "/api/analyze", 
                 "headers": {
                     "Content-Type": "application/json",
                     "Authorization": "Bearer your_access_token"
                 },
                 "body": {
-                    "search_query": "keyword (optional)",
-                    "start_date": "YYYY-MM-DD (optional)",
-                    "end_date": "YYYY-MM-DD (optional)", 
-                    "limit": "number (optional, max 100)"
+                    "entry_text": "Your journal entry",
+                    "user_id": "your_user_id"
                 },
                 "response": {
-                    "results": "Array of matching entries with analysis",
-                    "count": "Number of results",
-                    "search_params": "Echo of search parameters"
+                    "analysis": "Same as guest mode",
+                    "mindweave_reflection": "Enhanced with historical context",
+                    "mode": "user",
+                    "stored": True,
+                    "historical_entries_used": "Number of past entries analyzed"
                 }
             },
-            "user_management": {
-                "profile": {
-                    "method": "GET",
-                    "endpoint": "/api/user/profile",
-                    "headers": {"Authorization": "Bearer your_access_token"},
-                    "response": {
-                        "user": "User information",
-                        "stats": "Usage statistics and insights"
-                    }
-                },
-                "import_guest_data": {
-                    "method": "POST",
-                    "endpoint": "/api/user/import-guest-data",
-                    "headers": {
-                        "Content-Type": "application/json",
-                        "Authorization": "Bearer your_access_token"
-                    },
-                    "body": {
-                        "analyses": "Array of previous guest analyses to import"
-                    }
-                }
+            "streaming": {
+                "method": "POST",
+                "endpoint": "/api/analyze?stream=1",
+                "body": "Same as guest or user mode",
+                "response": "application/x-ndjson lines: analysis, reflection_delta (repeated), complete"
             }
         },
-        "features": {
-            "dual_mode_analysis": "Both guest and authenticated user modes",
-            "emotion_quantification": "Precise numerical emotion analysis (sum = 1.0)",
-            "historical_pattern_recognition": "AI analyzes 14-21 days of past entries",
-            "ysym_analysis": "You Said You Meant - reveals deeper emotions", 
-            "smart_triggering": "YSYM activates when negative emotions >= 60%",
-            "full_text_search": "Search entries with relevance scoring",
-            "data_persistence": "Secure storage with Row Level Security"
-        },
-        "response_times": {
-            "guest_mode": "1.5-3 seconds",
-            "user_mode": "3-5 seconds (includes historical analysis)",
-            "search": "200-500ms",
-            "authentication": "100-300ms"
-        },
-        "limits": {
-            "max_entry_length": 5000,
-            "ysym_trigger_threshold": 0.6,
-            "max_search_results": 100,
-            "historical_days_default": 21
-        },
-        "examples": {
-            "curl_guest_analysis": 'curl -X POST https://mind-be-ruddy.vercel.app/api/analyze -H "Content-Type: application/json" -d \'{"entry_text": "I feel great today!"}\'',
-            "curl_registration": 'curl -X POST https://mind-be-ruddy.vercel.app/api/auth/register -H "Content-Type: application/json" -d \'{"email": "test@example.com", "username": "testuser"}\'',
-            "curl_user_analysis": 'curl -X POST https://mind-be-ruddy.vercel.app/api/analyze -H "Content-Type: application/json" -H "Authorization: Bearer YOUR_TOKEN" -d \'{"entry_text": "Today was stressful", "user_id": "YOUR_USER_ID"}\'',
-            "curl_search": 'curl -X POST https://mind-be-ruddy.vercel.app/api/search -H "Content-Type: application/json" -H "Authorization: Bearer YOUR_TOKEN" -d \'{"search_query": "anxious", "limit": 10}\''
-        },
-        "error_handling": {
-            "400": "Bad Request - Invalid input or missing required fields",
-            "401": "Unauthorized - Invalid or missing authentication token", 
-            "500": "Internal Server Error - Temporary service issues",
-            "example_error": {
-                "error": "entry_text field is required",
-                "status": "error"
+        "search": {
+            "method": "POST",
+            "endpoint": "/api/search",
+            "headers": {
+                "Content-Type": "application/json",
+                "Authorization": "Bearer your_access_token"
+            },
+            "body": {
+                "search_query": "keyword (optional)",
+                "start_date": "YYYY-MM-DD (optional)",
+                "end_date": "YYYY-MM-DD (optional)", 
+                "limit": "number (optional, max 100)"
+            },
+            "response": {
+                "results": "Array of matching entries with analysis",
+                "count": "Number of results",
+                "search_params": "Echo of search parameters"
             }
         },
-        "integration_tips": {
-            "rate_limiting": "Implement 3-second debounce on analysis requests",
-            "error_handling": "Always check response.ok before processing data",
-            "token_management": "Store refresh tokens securely, access tokens have 24h expiry",
-            "offline_support": "Consider queuing requests when network is unavailable",
-            "user_experience": "Show loading states during analysis (3-5 second processing time)"
-        },
-        "support": {
-            "issues": "https://github.com/Gary0302/Mind_BE/issues",
-            "email": "gary@agryyang.in",
-            "documentation": "See README.md for detailed integration guides"
-        },
-        "environment": "vercel",
-        "database": "supabase_postgresql",
-        "ai_provider": "google_gemini",
-        "license": "MIT (will be updated in next version)",
-        "next_version_notes": {
-            "license_change": "New license terms will be applied",
-            "environment_variables": "Prompts will be configurable via environment variables",
-            "enhanced_features": "Weekly reviews and therapist mode"
+        "user_management": {
+            "profile": {
+                "method": "GET",
+                "endpoint": "/api/user/profile",
+                "headers": {"Authorization": "Bearer your_access_token"},
+                "response": {
+                    "user": "User information",
+                    "stats": "Usage statistics and insights"
+                }
+            },
+            "import_guest_data": {
+                "method": "POST",
+                "endpoint": "/api/user/import-guest-data",
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Authorization": "Bearer your_access_token"
+                },
+                "body": {
+                    "analyses": "Array of previous guest analyses to import"
+                }
+            }
         }
-    })
+    },
+    "features": {
+        "dual_mode_analysis": "Both guest and authenticated user modes",
+        "emotion_quantification": "Precise numerical emotion analysis (sum = 1.0)",
+        "historical_pattern_recognition": "AI analyzes 14-21 days of past entries",
+        "ysym_analysis": "You Said You Meant - reveals deeper emotions", 
+        "smart_triggering": "YSYM activates when negative emotions >= 60%",
+        "full_text_search": "Search entries with relevance scoring",
+        "data_persistence": "Secure storage with Row Level Security"
+    },
+    "response_times": {
+        "guest_mode": "1.5-3 seconds",
+        "user_mode": "3-5 seconds (includes historical analysis)",
+        "search": "200-500ms",
+        "authentication": "100-300ms"
+    },
+    "limits": API_LIMITS,
+    "examples": {
+        "curl_guest_analysis": 'curl -X POST https://mind-be-ruddy.vercel.app/api/analyze -H "Content-Type: application/json" -d \'{"entry_text": "I feel great today!"}\'',
+        "curl_registration": 'curl -X POST https://mind-be-ruddy.vercel.app/api/auth/register -H "Content-Type: application/json" -d \'{"email": "test@example.com", "username": "testuser"}\'',
+        "curl_user_analysis": 'curl -X POST https://mind-be-ruddy.vercel.app/api/analyze -H "Content-Type: application/json" -H "Authorization: Bearer YOUR_TOKEN" -d \'{"entry_text": "Today was stressful", "user_id": "YOUR_USER_ID"}\'',
+        "curl_search": 'curl -X POST https://mind-be-ruddy.vercel.app/api/search -H "Content-Type: application/json" -H "Authorization: Bearer YOUR_TOKEN" -d \'{"search_query": "anxious", "limit": 10}\''
+    },
+    "error_handling": {
+        "400": "Bad Request - Invalid input or missing required fields",
+        "401": "Unauthorized - Invalid or missing authentication token", 
+        "500": "Internal Server Error - Temporary service issues",
+        "example_error": {
+            "error": "entry_text field is required",
+            "status": "error"
+        }
+    },
+    "integration_tips": {
+        "rate_limiting": "Implement 3-second debounce on analysis requests",
+        "error_handling": "Always check response.ok before processing data",
+        "token_management": "Store refresh tokens securely, access tokens have 24h expiry",
+        "offline_support": "Consider queuing requests when network is unavailable",
+        "user_experience": "Show loading states during analysis (3-5 second processing time)"
+    },
+    "support": {
+        "issues": "https://github.com/Gary0302/Mind_BE/issues",
+        "email": "gary@agryyang.in",
+        "documentation": "See README.md for detailed integration guides"
+    },
+    "environment": "vercel",
+    "database": "supabase_postgresql",
+    "ai_provider": "google_gemini",
+    "license": "MIT (will be updated in next version)",
+    "next_version_notes": {
+        "license_change": "New license terms will be applied",
+        "environment_variables": "Prompts will be configurable via environment variables",
+        "enhanced_features": "Weekly reviews and therapist mode"
+    }
+}
+_HOME_BODY = OrjsonProvider.dumpb(HOME_DOCUMENTATION) + b"\n"
+
+# Fields of the health check that don't depend on the request
+HEALTH_INFO: Dict[str, Any] = {
+    "service": "mindweave-reflection-backend",
+    "version": "0.2.0",
+    "environment": "vercel"
+}
+
+@app.route('/')
+def home():
+    # A fresh Response per request, since CORS and other hooks mutate headers
+    return app.response_class(_HOME_BODY, mimetype='application/json')
 
 @app.route('/api/health')
 def health_check():
@@ -671,9 +1602,7 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "service": "mindweave-reflection-backend",
-        "version": "0.2.0",
-        "environment": "vercel",
+        **HEALTH_INFO,
         "integrations": {
             "gemini": "connected",
             "supabase": supabase_status
@@ -689,11 +1618,7 @@ def debug_supabase():
         if not db:
             return jsonify({
                 "error": "Supabase client not initialized",
-                "env_vars": {
-                    "SUPABASE_URL": "set" if os.getenv('SUPABASE_URL') else "missing",
-                    "SUPABASE_ANON_KEY": "set" if os.getenv('SUPABASE_ANON_KEY') else "missing",
-                    "JWT_SECRET": "set" if os.getenv('JWT_SECRET') else "missing"
-                }
+                "env_vars": ENV_STATUS
             }), 500
         
         # Test basic connection
@@ -709,21 +1634,13 @@ def debug_supabase():
             "supabase_client": "initialized",
             "tables_exist": tables_exist,
             "table_error": table_error if not tables_exist else None,
-            "env_vars": {
-                "SUPABASE_URL": "set" if os.getenv('SUPABASE_URL') else "missing",
-                "SUPABASE_ANON_KEY": "set" if os.getenv('SUPABASE_ANON_KEY') else "missing", 
-                "JWT_SECRET": "set" if os.getenv('JWT_SECRET') else "missing"
-            }
+            "env_vars": ENV_STATUS
         })
         
     except Exception as e:
         return jsonify({
             "error": f"Debug error: {str(e)}",
-            "env_vars": {
-                "SUPABASE_URL": "set" if os.getenv('SUPABASE_URL') else "missing",
-                "SUPABASE_ANON_KEY": "set" if os.getenv('SUPABASE_ANON_KEY') else "missing",
-                "JWT_SECRET": "set" if os.getenv('JWT_SECRET') else "missing"
-            }
+            "env_vars": ENV_STATUS
         }), 500
 
 # Authentication routes
@@ -757,7 +1674,7 @@ def register():
             return jsonify({"error": result['error']}), 400
             
     except Exception as e:
-        logger.error(f"Registration error: {str(e)}")
+        logger.error("Registration error: %s", e)
         return jsonify({"error": "Registration failed"}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -786,16 +1703,109 @@ def login():
         })
         
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
+        logger.error("Login error: %s", e)
         return jsonify({"error": "Login failed"}), 500
 
+# Store user-mode entries after responding instead of before. Off by default:
+# Vercel freezes the function once the response is sent, so only enable this on
+# long-running servers such as gunicorn
+DEFER_STORAGE_WRITES = os.getenv('DEFER_STORAGE_WRITES', '').lower() in ('1', 'true', 'yes')
+
+# Extra fields for guest-mode analysis responses
+GUEST_MESSAGE = "Analysis complete! Register to unlock historical insights and pattern tracking."
+GUEST_BENEFITS = (
+    "Track emotional patterns over time",
+    "Get insights based on your history",
+    "Search through past entries",
+    "Weekly and monthly reviews"
+)
+ENTRY_TOO_LONG_ERROR = f"entry_text too long (max {MAX_ENTRY_LENGTH} characters)"
+
+def store_analysis(db: SupabaseManager, user_id: str, entry_text: str, analysis_result: Dict[str, Any],
+                   mindweave_reflection: str, ysym_analysis: Optional[str]) -> bool:
+    """Store an entry and its analysis, logging the outcome"""
+    stored = db.store_entry_and_analysis(
+        user_id, 
+        entry_text, 
+        analysis_result, 
+        mindweave_reflection, 
+        ysym_analysis
+    )
+    if stored:
+        logger.info("Entry and analysis stored successfully")
+    else:
+        logger.warning("Failed to store entry and analysis")
+    return stored
+
+def _log_deferred_store_error(future: "concurrent.futures.Future[bool]") -> None:
+    if future.exception() is not None:
+        logger.error("Error storing data: %s", future.exception())
+
+def build_analysis_response(db: Optional[SupabaseManager], user_id: Optional[str], entry_text: str,
+                            historical_stats: Dict[str, Any], analysis_result: Dict[str, Any],
+                            mindweave_reflection: str, ysym_triggered: bool, ysym_analysis: Optional[str],
+                            start_time: float, defer_storage: bool = False) -> Dict[str, Any]:
+    """Assemble the /api/analyze response, storing the entry first in user mode
+    
+    With defer_storage the write runs on the shared event loop's thread pool
+    and "stored" is reported as "pending".
+    """
+    is_guest_mode = user_id is None
+    
+    negative_ratio = analysis_result.get('emotion_polarity', {}).get('negative', 0)
+    logger.info("Negative emotion ratio: %.2f, YSYM triggered: %s", negative_ratio, ysym_triggered)
+    
+    # Prepare response data
+    response_data = {
+        "analysis": analysis_result,
+        "mindweave_reflection": mindweave_reflection,
+        "ysym": ysym_triggered,
+        "mode": "guest" if is_guest_mode else "user",
+        "stored": False,
+        "status": "success"
+    }
+    
+    # Add mode-specific information
+    if is_guest_mode:
+        response_data["message"] = GUEST_MESSAGE
+        response_data["benefits"] = GUEST_BENEFITS
+    else:
+        response_data["historical_entries_used"] = historical_stats.get('entry_count', 0)
+    
+    if ysym_triggered:
+        response_data["ysym_analysis"] = ysym_analysis
+    
+    # Store data for user mode
+    if not is_guest_mode and db and defer_storage:
+        submit_async(asyncio.to_thread(
+            store_analysis, db, user_id, entry_text, analysis_result,
+            mindweave_reflection, response_data.get("ysym_analysis")
+        )).add_done_callback(_log_deferred_store_error)
+        response_data["stored"] = "pending"
+    elif not is_guest_mode and db:
+        try:
+            response_data["stored"] = store_analysis(
+                db, user_id, entry_text, analysis_result,
+                mindweave_reflection, response_data.get("ysym_analysis")
+            )
+        except Exception as e:
+            logger.error("Error storing data: %s", e)
+            response_data["storage_error"] = "Failed to save data, but analysis completed"
+    
+    # Calculate processing time (start_time comes from time.perf_counter())
+    response_data["processing_time"] = round(time.perf_counter() - start_time, 2)
+    
+    return response_data
+
 # Main analysis endpoint
 @app.route('/api/analyze', methods=['POST'])
 def analyze_entry():
-    start_time = datetime.now()
+    start_time = time.perf_counter()
     
     try:
         # Validate request
+        if (request.content_length or 0) > MAX_ANALYZE_BODY_BYTES:
+            return jsonify({"error": "Payload too large"}), 413
         if not request.is_json:
             return jsonify({"error": "Content-Type must be application/json"}), 400
         
@@ -804,107 +1814,86 @@ def analyze_entry():
             return jsonify({"error": "entry_text field is required"}), 400
         
         entry_text = data['entry_text']
-        if not isinstance(entry_text, str) or not entry_text.strip():
+        entry_text = entry_text.strip() if isinstance(entry_text, str) else ''
+        if not entry_text:
             return jsonify({"error": "entry_text must be a non-empty string"}), 400
-        
-        entry_text = entry_text.strip()
-        if len(entry_text) > 5000:
-            return jsonify({"error": "entry_text too long (max 5000 characters)"}), 400
+        if len(entry_text) > MAX_ENTRY_LENGTH:
+            return jsonify({"error": ENTRY_TOO_LONG_ERROR}), 400
         
         # Check if user_id is provided (user mode vs guest mode)
         user_id = data.get('user_id')
         is_guest_mode = user_id is None
         
-        # Initialize variables
-        historical_entries = []
-        stored = False
+        if analyzer is None:
+            return jsonify({"error": "Analysis service not configured"}), 503
         
-        analyzer_instance = get_analyzer()
         db = get_supabase()
         
-        # First API call: Emotion and topic analysis
-        logger.info(f"Starting analysis - Mode: {'guest' if is_guest_mode else 'user'}")
-        analysis_result = analyzer_instance.analyze_emotions_and_topics(entry_text)
-        
-        # Get historical context for user mode
-        if not is_guest_mode and db:
+        # Historical context for user mode loads while the emotion analysis runs;
+        # only the reflection waits for it. Check-ins answered locally never use it
+        history_future = None
+        if not is_guest_mode and db and not analyzer.is_trivial_entry(entry_text):
+            history_future = submit_async(asyncio.to_thread(db.get_user_entry_stats, user_id, days_back=HISTORICAL_DAYS_DEFAULT))
+        
+        def get_historical_stats(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+            if history_future is None:
+                return aggregate_entry_stats([])
+            # Never wait past the pipeline deadline, and not at all when the analysis
+            # fell back, since no reflection was built from the history then
+            if analysis_result.get('fallback_used'):
+                timeout = 0.0
+            else:
+                timeout = max(0.0, ANALYSIS_TIMEOUT_SECONDS - (time.perf_counter() - start_time))
             try:
-                historical_entries = db.get_user_historical_entries(user_id, days_back=21)
-                logger.info(f"Retrieved {len(historical_entries)} historical entries")
+                historical_stats = history_future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                logger.warning("Historical stats were not ready in time")
+                return aggregate_entry_stats([])
             except Exception as e:
-                logger.warning(f"Could not retrieve historical entries: {str(e)}")
-        
-        # Second API call: MindWeave reflection
-        logger.info("Generating MindWeave reflection")
-        mindweave_reflection = analyzer_instance.generate_mindweave_reflection(
-            entry_text, 
-            analysis_result, 
-            historical_entries, 
-            is_guest_mode
-        )
-        
-        # Check YSYM trigger (same threshold for both modes)
-        negative_ratio = analysis_result.get('emotion_polarity', {}).get('negative', 0)
-        ysym_triggered = negative_ratio >= 0.6
-        
-        logger.info(f"Negative emotion ratio: {negative_ratio:.2f}, YSYM triggered: {ysym_triggered}")
-        
-        # Prepare response data
-        response_data = {
-            "analysis": analysis_result,
-            "mindweave_reflection": mindweave_reflection,
-            "ysym": ysym_triggered,
-            "mode": "guest" if is_guest_mode else "user",
-            "stored": False,
-            "status": "success"
-        }
+                logger.warning("Could not retrieve historical entries: %s", e)
+                return aggregate_entry_stats([])
+            logger.info("Retrieved stats for %s historical entries", historical_stats.get('entry_count', 0))
+            return historical_stats
         
-        # Add mode-specific information
-        if is_guest_mode:
-            response_data["message"] = "Analysis complete! Register to unlock historical insights and pattern tracking."
-            response_data["benefits"] = [
-                "Track emotional patterns over time",
-                "Get insights based on your history",
-                "Search through past entries",
-                "Weekly and monthly reviews"
-            ]
-        else:
-            response_data["historical_entries_used"] = len(historical_entries)
+        # ?sync=1 waits for the write even when storage is deferred
+        defer_storage = DEFER_STORAGE_WRITES and request.args.get('sync') not in ('1', 'true')
         
-        # Third API call: YSYM analysis (if triggered)
-        if ysym_triggered:
-            logger.info("Generating YSYM analysis")
-            ysym_analysis = analyzer_instance.generate_ysym_analysis(entry_text, analysis_result)
-            response_data["ysym_analysis"] = ysym_analysis
+        logger.info("Starting analysis - Mode: %s", 'guest' if is_guest_mode else 'user')
         
-        # Store data for user mode
-        if not is_guest_mode and db:
-            try:
-                stored = db.store_entry_and_analysis(
-                    user_id, 
-                    entry_text, 
-                    analysis_result, 
-                    mindweave_reflection, 
-                    response_data.get("ysym_analysis")
-                )
-                response_data["stored"] = stored
-                if stored:
-                    logger.info("Entry and analysis stored successfully")
-                else:
-                    logger.warning("Failed to store entry and analysis")
-            except Exception as e:
-                logger.error(f"Error storing data: {str(e)}")
-                response_data["storage_error"] = "Failed to save data, but analysis completed"
+        # Optional NDJSON streaming: the analysis is sent first, then reflection text as it is generated
+        if request.args.get('stream') in ('1', 'true'):
+            events = analyzer.stream_reflection_pipeline(entry_text, history_future, is_guest_mode)
+            
+            def generate():
+                try:
+                    for event in iterate_async(events):
+                        if event['type'] == 'analysis':
+                            analysis_result, ysym_triggered = event['analysis'], event['ysym']
+                        elif event['type'] == 'reflection_complete':
+                            event = {'type': 'complete', **build_analysis_response(
+                                db, user_id, entry_text, get_historical_stats(analysis_result), analysis_result,
+                                event['mindweave_reflection'], ysym_triggered, event['ysym_analysis'], start_time,
+                                defer_storage
+                            )}
+                        yield OrjsonProvider.dumpb(event) + b"\n"
+                except Exception as e:
+                    logger.error("Error streaming entry analysis: %s", e)
+                    yield OrjsonProvider.dumpb({"type": "error", "error": "Internal server error", "status": "error"}) + b"\n"
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
-        # Calculate processing time
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
-        response_data["processing_time"] = round(processing_time, 2)
+        # Emotion analysis, then MindWeave reflection and YSYM (if triggered) concurrently
+        analysis_result, mindweave_reflection, ysym_triggered, ysym_analysis = run_async(
+            analyzer.run_reflection_pipeline(entry_text, history_future, is_guest_mode)
+        )
         
-        return jsonify(response_data)
+        return jsonify(build_analysis_response(
+            db, user_id, entry_text, get_historical_stats(analysis_result), analysis_result,
+            mindweave_reflection, ysym_triggered, ysym_analysis, start_time, defer_storage
+        ))
         
     except Exception as e:
-        logger.error(f"Error processing entry: {str(e)}")
+        logger.error("Error processing entry: %s", e)
         return jsonify({
             "error": "Internal server error",
             "message": str(e),
@@ -927,19 +1916,20 @@ def search_entries():
         search_query = data.get('search_query')
         start_date = data.get('start_date')
         end_date = data.get('end_date')
-        limit = min(data.get('limit', 50), 100)  # Max 100 results
+        limit = min(data.get('limit', 50), MAX_SEARCH_RESULTS)
         
-        # Validate date format if provided
+        # Validate date format if provided; only YYYY-MM-DD is accepted (fromisoformat
+        # would also take 20250101 or 2025-W01-1) and the parsed date is what gets queried
         if start_date:
             try:
-                parser.parse(start_date)
-            except ValueError:
+                start_date = datetime.strptime(start_date, '%Y-%m-%d').date().isoformat()
+            except (TypeError, ValueError):
                 return jsonify({"error": "Invalid start_date format. Use YYYY-MM-DD"}), 400
         
         if end_date:
             try:
-                parser.parse(end_date)
-            except ValueError:
+                end_date = datetime.strptime(end_date, '%Y-%m-%d').date().isoformat()
+            except (TypeError, ValueError):
                 return jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD"}), 400
         
         # Perform search
@@ -951,8 +1941,7 @@ def search_entries():
             limit=limit
         )
         
-        return jsonify({
-            "results": results,
+        summary = OrjsonProvider.dumpb({
             "count": len(results),
             "search_params": {
                 "query": search_query,
@@ -963,48 +1952,78 @@ def search_entries():
             "status": "success"
         })
         
+        # Encode one result at a time so the first bytes go out before the whole
+        # document is serialized; the body is the same object jsonify would send.
+        # The rows themselves are already fully loaded, so this saves no memory
+        def generate():
+            yield b'{"results":['
+            for i, row in enumerate(results):
+                yield (b',' if i else b'') + OrjsonProvider.dumpb(row)
+            yield b'],' + summary[1:]
+        
+        return Response(generate(), mimetype='application/json')
+        
     except Exception as e:
-        logger.error(f"Search error: {str(e)}")
+        logger.error("Search error: %s", e)
         return jsonify({"error": "Search failed", "message": str(e)}), 500
 
 # Test endpoint
+# Encoded /api/test responses; the sample never changes, so a real (non-fallback)
+# result is reused for an hour instead of rerunning the pipeline on every hit
+TEST_RESPONSE_TTL_SECONDS = 60 * 60
+_test_response_cache = ResponseCache(max_size=1, ttl=TEST_RESPONSE_TTL_SECONDS)
+SAMPLE_ENTRY = "I stayed up until 3am working on my startup again. I know I shouldn't but I feel so behind on everything. Sarah didn't reply to my message either, which makes me think she's avoiding me."
+
 @app.route('/api/test')
 def test_endpoint():
-    sample_entry = "I stayed up until 3am working on my startup again. I know I shouldn't but I feel so behind on everything. Sarah didn't reply to my message either, which makes me think she's avoiding me."
-    
     try:
-        analyzer_instance = get_analyzer()
+        if analyzer is None:
+            return jsonify({"error": "Analysis service not configured", "status": "error"}), 503
+        
+        body = _test_response_cache.get(SAMPLE_ENTRY)
+        if body is not None:
+            return test_response(body)
         
         # Test guest mode
         logger.info("Testing guest mode analysis")
-        analysis_result = analyzer_instance.analyze_emotions_and_topics(sample_entry)
-        mindweave_reflection = analyzer_instance.generate_mindweave_reflection(
-            sample_entry, analysis_result, None, True
+        analysis_result, mindweave_reflection, ysym_triggered, ysym_analysis = run_async(
+            analyzer.run_reflection_pipeline(SAMPLE_ENTRY, None, True)
         )
         
-        negative_ratio = analysis_result.get('emotion_polarity', {}).get('negative', 0)
-        ysym_triggered = negative_ratio >= 0.6
-        
         response_data = {
             "test_mode": "guest",
             "analysis": analysis_result,
             "mindweave_reflection": mindweave_reflection,
             "ysym": ysym_triggered,
             "status": "success",
-            "sample_entry": sample_entry,
+            "sample_entry": SAMPLE_ENTRY,
             "database_status": "connected" if get_supabase() else "not configured"
         }
         
         if ysym_triggered:
-            ysym_analysis = analyzer_instance.generate_ysym_analysis(sample_entry, analysis_result)
             response_data["ysym_analysis"] = ysym_analysis
         
-        return jsonify(response_data)
+        used_fallback = (
+            analysis_result.get('fallback_used')
+            or mindweave_reflection == analyzer._reflection_fallback(True)
+            or (ysym_triggered and ysym_analysis == analyzer._ysym_fallback())
+        )
+        if used_fallback:
+            return jsonify(response_data)
+        
+        body = OrjsonProvider.dumpb(response_data) + b"\n"
+        _test_response_cache.set(SAMPLE_ENTRY, body)
+        return test_response(body)
         
     except Exception as e:
-        logger.error(f"Test endpoint error: {str(e)}")
+        logger.error("Test endpoint error: %s", e)
         return jsonify({"error": str(e), "status": "error"}), 500
 
+def test_response(body: bytes) -> Response:
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['Cache-Control'] = f'public, max-age={TEST_RESPONSE_TTL_SECONDS}'
+    return response
+
 # User management endpoints
 @app.route('/api/user/profile', methods=['GET'])
 @require_auth
@@ -1020,29 +2039,20 @@ def get_user_profile():
         
         # Get user stats
         try:
-            historical_entries = db.get_user_historical_entries(request.user_id, days_back=30)
-            total_entries = len(historical_entries)
+            entry_stats = db.get_user_entry_stats(request.user_id, days_back=30)
             
             # Calculate basic stats
-            recent_emotions = {}
-            recent_topics = []
-            
-            for entry in historical_entries:
-                if entry.get('emotions_quantified'):
-                    for emotion, value in entry['emotions_quantified'].items():
-                        recent_emotions[emotion] = recent_emotions.get(emotion, 0) + value
-                
-                if entry.get('topics'):
-                    recent_topics.extend(entry['topics'])
+            recent_emotions = Counter(entry_stats['emotion_sums'])
+            recent_topics = Counter(entry_stats['topic_counts'])
             
             stats = {
-                "total_entries_30_days": total_entries,
-                "top_emotions": dict(sorted(recent_emotions.items(), key=lambda x: x[1], reverse=True)[:5]),
-                "top_topics": list(set(recent_topics))[:5]
+                "total_entries_30_days": entry_stats['entry_count'],
+                "top_emotions": dict(recent_emotions.most_common(5)),
+                "top_topics": [topic for topic, _ in recent_topics.most_common(5)]
             }
             
         except Exception as e:
-            logger.warning(f"Could not calculate stats: {str(e)}")
+            logger.warning("Could not calculate stats: %s", e)
             stats = {"total_entries_30_days": 0}
         
         return jsonify({
@@ -1052,7 +2062,7 @@ def get_user_profile():
         })
         
     except Exception as e:
-        logger.error(f"Profile error: {str(e)}")
+        logger.error("Profile error: %s", e)
         return jsonify({"error": "Could not fetch profile"}), 500
 
 # Import guest data endpoint
@@ -1071,94 +2081,112 @@ def import_guest_data():
         if not isinstance(guest_analyses, list):
             return jsonify({"error": "analyses must be a list"}), 400
         
-        imported_count = 0
         failed_count = 0
+        duplicate_count = 0
+        seen_entries = set()
+        
+        to_store = []
         
         for analysis_data in guest_analyses:
-            try:
-                # Validate required fields
-                if not all(key in analysis_data for key in ['entry_text', 'analysis', 'mindweave_reflection']):
-                    failed_count += 1
-                    continue
-                
-                # Store entry and analysis
-                success = db.store_entry_and_analysis(
-                    user_id=request.user_id,
-                    entry_text=analysis_data['entry_text'],
-                    analysis_result=analysis_data['analysis'],
-                    mindweave_reflection=analysis_data['mindweave_reflection'],
-                    ysym_analysis=analysis_data.get('ysym_analysis')
-                )
-                
-                if success:
-                    imported_count += 1
-                else:
-                    failed_count += 1
-                    
-            except Exception as e:
-                logger.warning(f"Failed to import one analysis: {str(e)}")
+            # Validate required fields
+            if not (isinstance(analysis_data, dict)
+                    and all(key in analysis_data for key in ['entry_text', 'analysis', 'mindweave_reflection'])
+                    and isinstance(analysis_data['analysis'], dict)):
                 failed_count += 1
+                continue
+            
+            # Client retries can resend the same item; only exact repeats (text,
+            # analysis including its timestamp, and reflections) are dropped, so
+            # separate entries with the same text are all kept
+            entry_key = hashlib.blake2b(
+                orjson.dumps(analysis_data, option=orjson.OPT_SORT_KEYS), digest_size=16
+            ).digest()
+            if entry_key in seen_entries:
+                duplicate_count += 1
+                continue
+            seen_entries.add(entry_key)
+            
+            to_store.append(analysis_data)
+        
+        # Store all entries and analyses in one batch
+        imported_count = db.store_entries_and_analyses(request.user_id, to_store)
+        failed_count += len(to_store) - imported_count
         
         return jsonify({
             "imported": imported_count,
             "failed": failed_count,
+            "duplicates": duplicate_count,
             "total_provided": len(guest_analyses),
             "status": "success" if imported_count > 0 else "failed"
         })
         
     except Exception as e:
-        logger.error(f"Import error: {str(e)}")
+        logger.error("Import error: %s", e)
         return jsonify({"error": "Import failed"}), 500
 
 # Utility endpoints
+VERSION_INFO: Dict[str, Any] = {
+    "version": "0.2.0",
+    "author": "Gary (gary@agryyang.in)",
+    "repository": "https://github.com/Gary0302/Mind_BE",
+    "features": {
+        "dual_mode_analysis": True,
+        "historical_patterns": True,
+        "entry_search": True,
+        "ysym_analysis": True,
+        "guest_data_import": True,
+        "therapist_mode": "planned"
+    },
+    "api_limits": API_LIMITS
+}
+_VERSION_BODY = OrjsonProvider.dumpb(VERSION_INFO) + b"\n"
+
 @app.route('/api/version')
 def version_info():
-    return jsonify({
-        "version": "0.2.0",
-        "author": "Gary (gary@agryyang.in)",
-        "repository": "https://github.com/Gary0302/Mind_BE",
-        "features": {
-            "dual_mode_analysis": True,
-            "historical_patterns": True,
-            "entry_search": True,
-            "ysym_analysis": True,
-            "guest_data_import": True,
-            "therapist_mode": "planned"
-        },
-        "api_limits": {
-            "max_entry_length": 5000,
-            "ysym_trigger_threshold": 0.6,
-            "max_search_results": 100,
-            "historical_days_default": 21
-        }
-    })
+    response = app.response_class(_VERSION_BODY, mimetype='application/json')
+    # Only changes with a deploy
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+# Error handlers. The 404 and 500 bodies never change, so they are encoded once
+NOT_FOUND_INFO: Dict[str, Any] = {
+    "error": "Endpoint not found",
+    "available_endpoints": {
+        "auth": ["/api/auth/register", "/api/auth/login"],
+        "analysis": ["/api/analyze", "/api/search"],
+        "user": ["/api/user/profile", "/api/user/import-guest-data"],
+        "utility": ["/api/health", "/api/test", "/api/version"]
+    }
+}
+_NOT_FOUND_BODY = OrjsonProvider.dumpb(NOT_FOUND_INFO) + b"\n"
+_INTERNAL_ERROR_BODY = OrjsonProvider.dumpb({
+    "error": "Internal server error",
+    "message": "Please try again later"
+}) + b"\n"
 
-# Error handlers
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({
-        "error": "Endpoint not found",
-        "available_endpoints": {
-            "auth": ["/api/auth/register", "/api/auth/login"],
-            "analysis": ["/api/analyze", "/api/search"],
-            "user": ["/api/user/profile", "/api/user/import-guest-data"],
-            "utility": ["/api/health", "/api/test", "/api/version"]
-        }
-    }), 404
+    return app.response_class(_NOT_FOUND_BODY, status=404, mimetype='application/json')
+
+@app.before_request
+def reject_oversized_body():
+    # Checked before the route runs: reading a body over MAX_CONTENT_LENGTH raises
+    # a 413 that the routes' catch-all handlers would turn into a 500
+    if (request.content_length or 0) > app.config['MAX_CONTENT_LENGTH']:
+        return payload_too_large(None)
+
+@app.errorhandler(413)
+def payload_too_large(error):
+    return jsonify({"error": "Payload too large"}), 413
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({
-        "error": "Internal server error",
-        "message": "Please try again later"
-    }), 500
+    return app.response_class(_INTERNAL_ERROR_BODY, status=500, mimetype='application/json')
 
 # Vercel handler
 app_handler = app
 
 if __name__ == '__main__':
-    # Load environment variables for local development
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    app.run(debug=True, port=5050)
\ No newline at end of file
+    # Debug mode's reloader imports the module twice and builds every client
+    # twice, so it is opt-in for local development
+    app.run(debug=os.getenv('FLASK_DEBUG', '0') == '1', port=int(os.getenv('PORT', '5050')))
\ No newline at end of file
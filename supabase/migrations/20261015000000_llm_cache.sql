@@ -0,0 +1,12 @@
+-- Shared cache of Gemini responses, keyed by a SHA-256 of model, temperature,
+-- system instruction and prompt (see GeminiAnalyzer._cached_generate)
+create table if not exists public.llm_cache (
+    cache_key text primary key,
+    response_text text not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists llm_cache_created_at_idx on public.llm_cache (created_at);
+
+-- Rows older than the backend's TTL are never read; prune them periodically, e.g.
+-- delete from public.llm_cache where created_at < now() - interval '1 day';
@@ -0,0 +1,32 @@
+-- Insert an entry and its analysis in one call and one transaction
+-- (used by SupabaseManager.store_entry_and_analysis). Parameter types follow
+-- the existing columns so the function stays in sync with the tables.
+create or replace function public.insert_entry_with_analysis(
+    p_user_id public.entries.user_id%type,
+    p_entry_text public.entries.entry_text%type,
+    p_emotions_quantified public.analyses.emotions_quantified%type,
+    p_emotion_polarity public.analyses.emotion_polarity%type,
+    p_topics public.analyses.topics%type,
+    p_mindweave_reflection public.analyses.mindweave_reflection%type,
+    p_ysym_triggered public.analyses.ysym_triggered%type,
+    p_ysym_analysis public.analyses.ysym_analysis%type,
+    p_analysis_version public.analyses.analysis_version%type
+)
+returns public.entries.entry_id%type
+language sql
+as $$
+    with new_entry as (
+        insert into public.entries (user_id, entry_text)
+        values (p_user_id, p_entry_text)
+        returning entry_id
+    )
+    insert into public.analyses (
+        entry_id, user_id, emotions_quantified, emotion_polarity, topics,
+        mindweave_reflection, ysym_triggered, ysym_analysis, analysis_version
+    )
+    select
+        entry_id, p_user_id, p_emotions_quantified, p_emotion_polarity, p_topics,
+        p_mindweave_reflection, p_ysym_triggered, p_ysym_analysis, p_analysis_version
+    from new_entry
+    returning entry_id;
+$$;
@@ -0,0 +1,38 @@
+-- Entry count, summed emotion scores and topic counts over a user's recent
+-- entries (used by SupabaseManager.get_user_entry_stats). Only the totals are
+-- returned instead of every entry in the window.
+create or replace function public.get_user_entry_stats(
+    p_user_id public.entries.user_id%type,
+    p_days_back integer default 21
+)
+returns json
+language sql
+stable
+as $$
+    with recent as (
+        select a.emotions_quantified, a.topics
+        from public.entries e
+        join public.analyses a on a.entry_id = e.entry_id
+        where e.user_id = p_user_id
+          and e.created_at >= now() - make_interval(days => p_days_back)
+    )
+    select json_build_object(
+        'entry_count', (select count(*) from recent),
+        'emotion_sums', coalesce((
+            select json_object_agg(emotion.key, emotion.total)
+            from (
+                select kv.key, sum((kv.value #>> '{}')::float8) as total
+                from recent, jsonb_each(recent.emotions_quantified::jsonb) as kv
+                group by kv.key
+            ) as emotion
+        ), '{}'::json),
+        'topic_counts', coalesce((
+            select json_object_agg(topic.name, topic.total)
+            from (
+                select t.name, count(*) as total
+                from recent, jsonb_array_elements_text(to_jsonb(recent.topics)) as t(name)
+                group by t.name
+            ) as topic
+        ), '{}'::json)
+    );
+$$;
@@ -0,0 +1,39 @@
+-- Bulk variant of insert_entry_with_analysis (used by
+-- SupabaseManager.store_entries_and_analyses for guest data imports). Takes a
+-- JSON array of {entry_text, emotions_quantified, ...} objects and writes every
+-- entry and analysis in one call and one transaction. Returns the row count.
+create or replace function public.insert_entries_with_analyses(
+    p_user_id public.entries.user_id%type,
+    p_items jsonb
+)
+returns integer
+language plpgsql
+as $$
+declare
+    v_item jsonb;
+    v_entry_id public.entries.entry_id%type;
+    v_count integer := 0;
+begin
+    for v_item in select value from jsonb_array_elements(p_items)
+    loop
+        insert into public.entries (user_id, entry_text)
+        select p_user_id, item.entry_text
+        from jsonb_populate_record(null::public.entries, v_item) as item
+        returning entry_id into v_entry_id;
+
+        -- jsonb_populate_record casts each field to its column type
+        insert into public.analyses (
+            entry_id, user_id, emotions_quantified, emotion_polarity, topics,
+            mindweave_reflection, ysym_triggered, ysym_analysis, analysis_version
+        )
+        select
+            v_entry_id, p_user_id, item.emotions_quantified, item.emotion_polarity, item.topics,
+            item.mindweave_reflection, item.ysym_triggered, item.ysym_analysis, item.analysis_version
+        from jsonb_populate_record(null::public.analyses, v_item) as item;
+
+        v_count := v_count + 1;
+    end loop;
+
+    return v_count;
+end;
+$$;
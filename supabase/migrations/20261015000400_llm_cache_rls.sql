@@ -0,0 +1,8 @@
+-- llm_cache holds reflection and YSYM text written from users' entries, so keep it
+-- away from the anon and authenticated roles: with row level security on and no
+-- policies, only the service-role key (SUPABASE_SERVICE_ROLE_KEY) can read or
+-- write it. The backend deletes expired rows itself (see
+-- SupabaseManager.store_llm_response).
+alter table public.llm_cache enable row level security;
+
+revoke all on table public.llm_cache from anon, authenticated;
@@ -0,0 +1,562 @@
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import jwt
+import pytest
+
+import main
+
+GOOD_ITEM = {
+    "entry_text": "Finished the report and went for a run.",
+    "analysis": {
+        "emotions_quantified": {"proud": 0.6, "calm": 0.4},
+        "emotion_polarity": {"positive": 1.0, "negative": 0.0},
+        "topics": ["work", "exercise"],
+    },
+    "mindweave_reflection": "A good day.",
+}
+BAD_ITEM = {
+    "entry_text": "Couldn't sleep again.",
+    "analysis": {"emotion_polarity": None},
+    "mindweave_reflection": "Rest matters.",
+}
+
+
+class StubPostgrest:
+    """Answers Supabase REST calls from per-path handlers and records them"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.calls = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append((request.url.path, json.loads(request.content or b"null")))
+        for path, handler in self.handlers.items():
+            if request.url.path.endswith(path):
+                return handler(request)
+        return httpx.Response(404, json={"code": "PGRST202", "message": "not found", "details": None, "hint": None})
+
+    def paths(self):
+        return [path for path, _ in self.calls]
+
+
+@pytest.fixture
+def postgrest(monkeypatch):
+    stub = StubPostgrest()
+    db = main.SupabaseManager("http://supabase.test", "anon-key", "service-key")
+    db.http_client._transport = httpx.MockTransport(stub)
+    db.cache_http_client._transport = httpx.MockTransport(stub)
+    monkeypatch.setattr(main, "supabase", db)
+    return stub
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """A GeminiAnalyzer whose API calls return canned responses without a network"""
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    analyzer = main.GeminiAnalyzer("test-key")
+
+    async def generate_content(model, contents, config):
+        if config.response_schema is not None:
+            return SimpleNamespace(text=json.dumps({
+                "emotions_quantified": [{"emotion": "stressed", "value": 1.0}],
+                "emotion_polarity": {"positive": 0.2, "negative": 0.8},
+                "topics": ["work"],
+                "reflection": "A reflection.",
+            }))
+        return SimpleNamespace(text="A reflection.")
+
+    async def generate_content_stream(model, contents, config):
+        async def chunks():
+            for text in ("A ", "streamed ", "reflection."):
+                yield SimpleNamespace(text=text)
+        return chunks()
+
+    monkeypatch.setattr(analyzer.client.aio.models, "generate_content", generate_content)
+    monkeypatch.setattr(analyzer.client.aio.models, "generate_content_stream", generate_content_stream)
+    monkeypatch.setattr(main, "analyzer", analyzer)
+    return analyzer
+
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+
+def auth_headers():
+    token = jwt.encode(
+        {"user_id": "user-1", "type": "access", "exp": int(time.time()) + 60},
+        main.JWT_SECRET,
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def stream_events(response):
+    return [json.loads(line) for line in response.get_data().splitlines()]
+
+
+def import_items(client, items):
+    return client.post("/api/user/import-guest-data", json={"analyses": items}, headers=auth_headers())
+
+
+def test_import_sends_only_well_formed_items_in_bulk(client, postgrest):
+    postgrest.handlers["/rpc/insert_entries_with_analyses"] = (
+        lambda request: httpx.Response(200, json=len(json.loads(request.content)["p_items"]))
+    )
+
+    response = import_items(client, [GOOD_ITEM, BAD_ITEM])
+
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 1
+    assert response.get_json()["failed"] == 1
+    (_, payload), = postgrest.calls
+    assert [item["entry_text"] for item in payload["p_items"]] == [GOOD_ITEM["entry_text"]]
+
+
+def test_import_falls_back_to_single_inserts_without_bulk_function(client, postgrest):
+    postgrest.handlers["/rpc/insert_entry_with_analysis"] = lambda request: httpx.Response(200, json="entry-1")
+
+    response = import_items(client, [GOOD_ITEM, BAD_ITEM])
+
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 1
+    assert response.get_json()["failed"] == 1
+    assert postgrest.paths().count("/rest/v1/rpc/insert_entry_with_analysis") == 1
+
+
+def test_import_falls_back_to_single_inserts_when_bulk_call_errors(client, postgrest):
+    def bulk_timeout(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    postgrest.handlers["/rpc/insert_entries_with_analyses"] = bulk_timeout
+    postgrest.handlers["/rpc/insert_entry_with_analysis"] = lambda request: httpx.Response(200, json="entry-1")
+
+    response = import_items(client, [GOOD_ITEM, BAD_ITEM])
+
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 1
+    assert response.get_json()["failed"] == 1
+
+
+def test_import_keeps_same_text_entries_and_drops_exact_repeats(client, postgrest):
+    postgrest.handlers["/rpc/insert_entries_with_analyses"] = (
+        lambda request: httpx.Response(200, json=len(json.loads(request.content)["p_items"]))
+    )
+    monday = {**GOOD_ITEM, "entry_text": "ok", "analysis": {**GOOD_ITEM["analysis"], "timestamp": "2026-10-12T09:00:00+00:00"}}
+    tuesday = {**GOOD_ITEM, "entry_text": "ok", "analysis": {**GOOD_ITEM["analysis"], "timestamp": "2026-10-13T09:00:00+00:00"}}
+
+    response = import_items(client, [monday, tuesday, dict(monday)])
+
+    assert response.get_json()["imported"] == 2
+    assert response.get_json()["duplicates"] == 1
+
+
+def test_analyze_does_not_wait_for_history_past_the_deadline(client, postgrest, gemini, monkeypatch):
+    monkeypatch.setattr(main, "ANALYSIS_TIMEOUT_SECONDS", 0.5)
+    release = threading.Event()
+
+    def slow_stats(request):
+        release.wait(5)
+        return httpx.Response(200, json={"entry_count": 3, "emotion_sums": {}, "topic_counts": {}})
+
+    postgrest.handlers["/rpc/get_user_entry_stats"] = slow_stats
+    try:
+        started = time.perf_counter()
+        response = client.post("/api/analyze", json={"entry_text": "Deadlines everywhere this week.", "user_id": "user-1"})
+        elapsed = time.perf_counter() - started
+    finally:
+        release.set()
+
+    assert response.status_code == 200
+    assert response.get_json()["historical_entries_used"] == 0
+    assert elapsed < 2
+
+
+def test_streamed_analysis_does_not_wait_for_history_past_the_deadline(client, postgrest, gemini, monkeypatch):
+    monkeypatch.setattr(main, "ANALYSIS_TIMEOUT_SECONDS", 0.5)
+    release = threading.Event()
+
+    def slow_stats(request):
+        release.wait(5)
+        return httpx.Response(200, json={"entry_count": 3, "emotion_sums": {}, "topic_counts": {}})
+
+    postgrest.handlers["/rpc/get_user_entry_stats"] = slow_stats
+    try:
+        started = time.perf_counter()
+        response = client.post(
+            "/api/analyze?stream=1", json={"entry_text": "Deadlines everywhere this week.", "user_id": "user-1"}
+        )
+        events = stream_events(response)
+        elapsed = time.perf_counter() - started
+    finally:
+        release.set()
+
+    assert events[-1]["type"] == "complete"
+    assert events[-1]["historical_entries_used"] == 0
+    assert events[-1]["mindweave_reflection"] == gemini._reflection_fallback(False)
+    assert elapsed < 2
+
+
+def test_streamed_analysis_does_not_wait_for_ysym_past_the_deadline(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "ANALYSIS_TIMEOUT_SECONDS", 0.5)
+    monkeypatch.setattr(main, "supabase", None)
+    generate_content = gemini.client.aio.models.generate_content
+
+    async def slow_ysym(model, contents, config):
+        if config.system_instruction == main.YSYM_INSTRUCTIONS:
+            await asyncio.sleep(5)
+        return await generate_content(model=model, contents=contents, config=config)
+
+    monkeypatch.setattr(gemini.client.aio.models, "generate_content", slow_ysym)
+
+    started = time.perf_counter()
+    events = stream_events(client.post("/api/analyze?stream=1", json={"entry_text": "Deadlines everywhere this week."}))
+    elapsed = time.perf_counter() - started
+
+    assert events[-1]["type"] == "complete"
+    assert events[-1]["ysym"] is True
+    assert events[-1]["ysym_analysis"] == gemini._ysym_fallback()
+    assert elapsed < 2
+
+
+def test_streamed_analysis_sends_events_in_order(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+
+    events = stream_events(client.post("/api/analyze?stream=1", json={"entry_text": "Long day, but the demo went well."}))
+
+    assert [event["type"] for event in events] == ["analysis", "reflection_delta", "reflection_delta", "reflection_delta", "complete"]
+    assert events[0]["analysis"]["topics"] == ["work"]
+    assert events[-1]["mindweave_reflection"] == "A streamed reflection."
+    assert "".join(event["text"] for event in events[1:-1]) == "A streamed reflection."
+
+
+def test_streamed_reflection_from_cache_is_sent_as_one_chunk(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+    entry = {"entry_text": "Long day, but the demo went well."}
+    stream_events(client.post("/api/analyze?stream=1", json=entry))
+
+    events = stream_events(client.post("/api/analyze?stream=1", json=entry))
+
+    deltas = [event["text"] for event in events if event["type"] == "reflection_delta"]
+    assert deltas == ["A streamed reflection."]
+
+
+def test_streamed_analysis_closes_the_pipeline_on_disconnect(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+    closed = threading.Event()
+    pipeline = gemini.stream_reflection_pipeline
+
+    async def tracked_pipeline(*args):
+        try:
+            async for event in pipeline(*args):
+                yield event
+        finally:
+            closed.set()
+
+    # Held here so garbage collection can't be what finalizes the pipeline
+    pipelines = []
+
+    def start_pipeline(*args):
+        pipelines.append(tracked_pipeline(*args))
+        return pipelines[-1]
+
+    monkeypatch.setattr(gemini, "stream_reflection_pipeline", start_pipeline)
+
+    response = client.post("/api/analyze?stream=1", json={"entry_text": "Long day, but the demo went well."}, buffered=False)
+    lines = iter(response.response)
+    assert json.loads(next(lines))["type"] == "analysis"
+    response.close()
+
+    assert closed.wait(1)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_trivial_check_in_is_answered_without_gemini(client, gemini, monkeypatch, stream):
+    monkeypatch.setattr(main, "supabase", None)
+    calls = []
+
+    async def no_gemini(model, contents, config):
+        calls.append(contents)
+        raise AssertionError("Gemini was called")
+
+    monkeypatch.setattr(gemini.client.aio.models, "generate_content", no_gemini)
+    monkeypatch.setattr(gemini.client.aio.models, "generate_content_stream", no_gemini)
+
+    response = client.post("/api/analyze?stream=1" if stream else "/api/analyze", json={"entry_text": "Great day!"})
+    result = stream_events(response)[-1] if stream else response.get_json()
+
+    assert calls == []
+    assert result["mindweave_reflection"] == main.TRIVIAL_REFLECTION
+    assert result["analysis"]["emotions_quantified"] == {"happy": 1.0}
+    assert result["analysis"]["emotion_polarity"] == {"positive": 0.9, "negative": 0.1}
+    assert result["analysis"]["topics"] == ["check-in"]
+    assert result["ysym"] is False
+
+
+def test_analyze_skips_history_for_trivial_check_ins(client, postgrest, gemini):
+    response = client.post("/api/analyze", json={"entry_text": "ok", "user_id": "user-1"})
+
+    assert response.status_code == 200
+    assert "/rest/v1/rpc/get_user_entry_stats" not in postgrest.paths()
+
+
+def test_analysis_responses_are_shared_through_llm_cache(client, postgrest, gemini):
+    postgrest.handlers["/llm_cache"] = lambda request: httpx.Response(200, json=[])
+
+    response = client.post("/api/analyze", json={"entry_text": "Long day, but the demo went well.", "user_id": "user-1"})
+
+    assert response.status_code == 200
+    deadline = time.monotonic() + 2
+    while gemini._cache_writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stored = [payload for path, payload in postgrest.calls if path == "/rest/v1/llm_cache" and payload]
+    assert stored and all(row["response_text"] for row in stored)
+
+
+def test_guest_analysis_stays_out_of_llm_cache(client, postgrest, gemini):
+    postgrest.handlers["/llm_cache"] = lambda request: httpx.Response(200, json=[])
+
+    response = client.post("/api/analyze", json={"entry_text": "Long day, but the demo went well."})
+
+    assert response.status_code == 200
+    assert not gemini._cache_writes
+    assert "/rest/v1/llm_cache" not in postgrest.paths()
+
+
+def test_slow_llm_cache_lookup_counts_as_a_miss(postgrest, gemini):
+    release = threading.Event()
+
+    def slow_lookup(request):
+        release.wait(5)
+        return httpx.Response(200, json=[{"response_text": "stale"}])
+
+    postgrest.handlers["/llm_cache"] = slow_lookup
+
+    async def scenario():
+        started = time.perf_counter()
+        cached = await gemini._cache_lookup("key")
+        elapsed = time.perf_counter() - started
+        release.set()
+        return cached, elapsed
+
+    cached, elapsed = asyncio.run(scenario())
+
+    assert cached is None
+    assert elapsed < main.LLM_CACHE_LOOKUP_TIMEOUT_SECONDS + 0.5
+
+
+def test_llm_cache_is_disabled_when_the_table_is_missing(postgrest):
+    postgrest.handlers["/llm_cache"] = lambda request: httpx.Response(
+        404, json={"code": "PGRST205", "message": "table not found", "details": None, "hint": None}
+    )
+
+    assert main.supabase.get_cached_llm_response("key", 60) is None
+    assert main.supabase.store_llm_response("key", "text", 60) is False
+    assert postgrest.paths() == ["/rest/v1/llm_cache"]
+
+
+def test_unfiltered_search_reports_numeric_relevance(client, postgrest):
+    postgrest.handlers["/entries"] = lambda request: httpx.Response(200, json=[{
+        "entry_id": "entry-1",
+        "entry_text": GOOD_ITEM["entry_text"],
+        "created_at": "2026-10-14T09:00:00+00:00",
+        "analyses": [{"emotions_quantified": {"proud": 1.0}, "topics": ["work"]}],
+    }])
+
+    response = client.post("/api/search", json={}, headers=auth_headers())
+
+    assert response.status_code == 200
+    assert [result["relevance_score"] for result in response.get_json()["results"]] == [0.0]
+
+
+def test_caller_joining_a_cancelled_shared_call_gets_a_fresh_one(gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+    calls = []
+
+    async def generate_content(model, contents, config):
+        calls.append(contents)
+        if len(calls) == 1:
+            await asyncio.Event().wait()
+        return SimpleNamespace(text="fresh")
+
+    monkeypatch.setattr(gemini.client.aio.models, "generate_content", generate_content)
+
+    async def scenario():
+        first = asyncio.create_task(gemini._cached_generate("prompt", temperature=0.4))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        # Joins before the shared call's cancellation has completed
+        second = asyncio.create_task(gemini._cached_generate("prompt", temperature=0.4))
+        return await asyncio.wait_for(second, 1)
+
+    assert asyncio.run(scenario()) == "fresh"
+    assert len(calls) == 2
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """Drives TokenBucket with a manual clock; asyncio.sleep advances it instead of waiting"""
+    clock = SimpleNamespace(now=0.0, sleeps=[])
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+        await real_sleep(0)
+
+    monkeypatch.setattr(main, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return clock
+
+
+def test_token_bucket_waits_for_requests_to_refill(fake_clock):
+    async def scenario():
+        bucket = main.TokenBucket(rpm=2)
+        await bucket.acquire()
+        await bucket.acquire()
+        assert fake_clock.sleeps == []
+        await bucket.acquire()
+
+    asyncio.run(scenario())
+
+    assert fake_clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_token_bucket_waits_for_tokens_to_refill(fake_clock):
+    async def scenario():
+        bucket = main.TokenBucket(rpm=1000, tpm=600)
+        await bucket.acquire(600)
+        await bucket.acquire(100)
+
+    asyncio.run(scenario())
+
+    assert fake_clock.sleeps == [pytest.approx(10.0)]
+
+
+def test_token_bucket_limits_are_off_when_unset(fake_clock, monkeypatch):
+    async def scenario():
+        bucket = main.TokenBucket(rpm=1000, tpm=None)
+        for _ in range(10):
+            await bucket.acquire(10 ** 6)
+
+    asyncio.run(scenario())
+    # GEMINI_RPM=0 is read as None, which leaves the analyzer without a limiter
+    monkeypatch.setattr(main, "GEMINI_RPM", None)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+
+    assert fake_clock.sleeps == []
+    assert main.GeminiAnalyzer("test-key").rate_limiter is None
+
+
+def padded_body(payload, size):
+    """JSON body of exactly size bytes, padded with an extra field"""
+    body = json.dumps({**payload, "padding": ""})
+    return body[:-2] + "x" * (size - len(body)) + body[-2:]
+
+
+def test_analyze_rejects_bodies_over_its_limit(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+    entry = {"entry_text": "ok"}
+
+    accepted = client.post("/api/analyze", data=padded_body(entry, main.MAX_ANALYZE_BODY_BYTES), content_type="application/json")
+    rejected = client.post("/api/analyze", data=padded_body(entry, main.MAX_ANALYZE_BODY_BYTES + 1), content_type="application/json")
+
+    assert accepted.status_code == 200
+    assert rejected.status_code == 413
+    assert rejected.get_json() == {"error": "Payload too large"}
+
+
+def test_requests_over_max_content_length_get_a_json_413(client, postgrest):
+    postgrest.handlers["/rpc/insert_entries_with_analyses"] = (
+        lambda request: httpx.Response(200, json=len(json.loads(request.content)["p_items"]))
+    )
+    limit = main.app.config["MAX_CONTENT_LENGTH"]
+    payload = {"analyses": [GOOD_ITEM]}
+
+    accepted = client.post("/api/user/import-guest-data", data=padded_body(payload, limit),
+                           content_type="application/json", headers=auth_headers())
+    rejected = client.post("/api/user/import-guest-data", data=padded_body(payload, limit + 1),
+                           content_type="application/json", headers=auth_headers())
+
+    assert accepted.status_code == 200
+    assert accepted.get_json()["imported"] == 1
+    assert rejected.status_code == 413
+    assert rejected.get_json() == {"error": "Payload too large"}
+
+
+def test_test_endpoint_reuses_its_response_for_an_hour(client, gemini, monkeypatch):
+    monkeypatch.setattr(main, "supabase", None)
+    monkeypatch.setattr(main, "_test_response_cache", main.ResponseCache(max_size=1, ttl=main.TEST_RESPONSE_TTL_SECONDS))
+    runs = []
+    pipeline = gemini.run_reflection_pipeline
+
+    async def counted_pipeline(*args):
+        runs.append(args)
+        return await pipeline(*args)
+
+    monkeypatch.setattr(gemini, "run_reflection_pipeline", counted_pipeline)
+
+    first = client.get("/api/test")
+    second = client.get("/api/test")
+
+    assert len(runs) == 1
+    assert second.get_data() == first.get_data()
+    assert second.get_json()["status"] == "success"
+    for response in (first, second):
+        assert response.headers["Cache-Control"] == "public, max-age=3600"
+
+
+def test_cached_token_is_rejected_once_expired(monkeypatch):
+    monkeypatch.setattr(main, "_token_cache", main.ResponseCache(max_size=16, ttl=5 * 60))
+    exp = int(time.time()) + 60
+    token = jwt.encode({"user_id": "user-1", "type": "access", "exp": exp}, main.JWT_SECRET, algorithm="HS256")
+
+    assert main.decode_access_token(token)["user_id"] == "user-1"
+    assert main._token_cache.get(token) is not None
+
+    monkeypatch.setattr(main, "time", SimpleNamespace(time=lambda: exp + 1, monotonic=time.monotonic))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        main.decode_access_token(token)
+
+
+def test_tampered_token_is_never_served_from_the_cache(client, postgrest, monkeypatch):
+    monkeypatch.setattr(main, "_token_cache", main.ResponseCache(max_size=16, ttl=5 * 60))
+    token = auth_headers()["Authorization"].split(" ")[1]
+    main.decode_access_token(token)
+    header, payload, signature = token.split(".")
+    forged = jwt.encode(
+        {"user_id": "user-2", "type": "access", "exp": int(time.time()) + 60}, "other-secret", algorithm="HS256"
+    ).split(".")
+
+    # Another user's claims under the cached token's signature, and the cached
+    # token's claims under a signature from the wrong key
+    for tampered in (f"{header}.{forged[1]}.{signature}", f"{header}.{payload}.{forged[2]}"):
+        with pytest.raises(jwt.InvalidSignatureError):
+            main.decode_access_token(tampered)
+        assert main._token_cache.get(tampered) is None
+        response = client.post("/api/search", json={}, headers={"Authorization": f"Bearer {tampered}"})
+        assert response.status_code == 401
+
+
+@pytest.mark.parametrize("value", ["20250101", "2025-W01-1", "2025-01-01T00:00", "01/01/2025"])
+def test_search_rejects_dates_that_are_not_yyyy_mm_dd(client, postgrest, value):
+    response = client.post("/api/search", json={"start_date": value}, headers=auth_headers())
+
+    assert response.status_code == 400
+    assert postgrest.calls == []
+
+
+def test_search_queries_the_parsed_dates(client, postgrest):
+    postgrest.handlers["/rpc/search_user_entries"] = lambda request: httpx.Response(200, json=[])
+
+    response = client.post("/api/search", json={"start_date": "2025-1-5", "end_date": "2025-02-01"}, headers=auth_headers())
+
+    assert response.status_code == 200
+    (_, params), = postgrest.calls
+    assert (params["p_start_date"], params["p_end_date"]) == ("2025-01-05", "2025-02-01")